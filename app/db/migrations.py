@@ -0,0 +1,99 @@
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import UpdateOne
+from collections import defaultdict
+from datetime import datetime
+import asyncio
+import pytz
+
+from app.db.mongo import client, MONGO_DB_NAME
+from app.services.shard_membership import shard_hash
+
+
+async def migrate_conversations_to_buckets(db: AsyncIOMotorDatabase) -> int:
+    """Move the legacy `conversations.messages` arrays into daily buckets.
+
+    Safe to run repeatedly: messages are merged with `$addToSet` and re-sorted,
+    and the legacy array is only removed once its buckets are written.
+    """
+    jakarta = pytz.timezone("Asia/Jakarta")
+    conversations = db["conversations"]
+    buckets = db["conversation_buckets"]
+    migrated = 0
+
+    cursor = conversations.find({"messages": {"$exists": True}})
+    async for doc in cursor:
+        user_id = doc["_id"]
+        by_date = defaultdict(list)
+        for m in doc.get("messages") or []:
+            ts = m.get("timestamp") or doc.get("created_at") or datetime.utcnow()
+            if ts.tzinfo is None:
+                ts = pytz.utc.localize(ts)
+            by_date[ts.astimezone(jakarta).strftime("%Y-%m-%d")].append(m)
+
+        now = datetime.now(jakarta)
+        operations = []
+        for date, messages in by_date.items():
+            bucket_filter = {"user_id": user_id, "date": date}
+            operations.append(
+                UpdateOne(
+                    bucket_filter,
+                    {
+                        "$addToSet": {"messages": {"$each": messages}},
+                        "$set": {"updated_at": now},
+                        "$setOnInsert": {
+                            "created_at": messages[0].get("timestamp", now)
+                        },
+                    },
+                    upsert=True,
+                )
+            )
+            operations.append(
+                UpdateOne(
+                    bucket_filter,
+                    {"$push": {"messages": {"$each": [], "$sort": {"timestamp": 1}}}},
+                )
+            )
+        if operations:
+            await buckets.bulk_write(operations, ordered=True)
+            # Recount after the merge, duplicates were dropped by $addToSet
+            await buckets.update_many(
+                {"user_id": user_id, "date": {"$in": list(by_date.keys())}},
+                [{"$set": {"message_count": {"$size": "$messages"}}}],
+            )
+
+        await conversations.update_one({"_id": user_id}, {"$unset": {"messages": ""}})
+        migrated += 1
+
+    return migrated
+
+
+async def backfill_user_shard_hash(db: AsyncIOMotorDatabase) -> int:
+    """Store `shard_hash` on users created before sharded scheduling existed"""
+    updated = 0
+    operations = []
+    cursor = db["users"].find({"shard_hash": {"$exists": False}}, {"_id": 1})
+    async for doc in cursor:
+        operations.append(
+            UpdateOne(
+                {"_id": doc["_id"]}, {"$set": {"shard_hash": shard_hash(doc["_id"])}}
+            )
+        )
+        if len(operations) >= 1000:
+            result = await db["users"].bulk_write(operations, ordered=False)
+            updated += result.modified_count
+            operations = []
+    if operations:
+        result = await db["users"].bulk_write(operations, ordered=False)
+        updated += result.modified_count
+    return updated
+
+
+async def main():
+    count = await migrate_conversations_to_buckets(client[MONGO_DB_NAME])
+    print(f"Migrated {count} conversations")
+    count = await backfill_user_shard_hash(client[MONGO_DB_NAME])
+    print(f"Backfilled shard_hash on {count} users")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
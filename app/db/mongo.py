@@ -3,7 +3,11 @@ from dotenv import load_dotenv
 from pymongo.errors import ServerSelectionTimeoutError
 import os
 import logging
-from pymongo import ASCENDING
+from pymongo import ASCENDING, DESCENDING
+from app.services.classification_cache import CLASSIFICATION_CACHE_TTL
+from app.services.job_checkpoint import JOB_CHECKPOINT_TTL
+from app.services.job_queue import JOB_QUEUE_DONE_TTL
+from app.services.window_cursor import WINDOW_CURSOR_TTL
 
 load_dotenv()
 logger = logging.getLogger(__name__)
@@ -27,6 +31,7 @@ async def connect_to_mongo():
         db = client[MONGO_DB_NAME]
         print("[MongoDB] Connected successfully to", MONGO_URI)
         await init_indexes()
+        await run_migrations()
     except ServerSelectionTimeoutError as e:
         print(f"[MongoDB] Connection failed: {e}")
         db = None  # or raise custom error
@@ -42,6 +47,9 @@ async def init_indexes():
     if db is None:
         raise RuntimeError("Database not initialized")
 
+    # Scheduler jobs select the users of the timezones that are due
+    await db["users"].create_index([("timezone", ASCENDING)], name="idx_timezone")
+
     await db["daily_progress"].create_index(
         [("telegram_id", ASCENDING), ("date", ASCENDING)],
         unique=True,
@@ -53,4 +61,88 @@ async def init_indexes():
         name="idx_telegram_date_unique",
     )
 
+    await db["conversation_buckets"].create_index(
+        [("user_id", ASCENDING), ("date", ASCENDING)],
+        unique=True,
+        name="idx_user_date_unique",
+    )
+
+    await db["conversation_buckets"].create_index(
+        [("date", ASCENDING)], name="idx_date"
+    )
+
+    await db["job_checkpoints"].create_index(
+        [("job", ASCENDING), ("run_key", ASCENDING)], name="idx_job_run"
+    )
+    await db["job_checkpoints"].create_index(
+        [("created_at", ASCENDING)],
+        expireAfterSeconds=JOB_CHECKPOINT_TTL,
+        name="idx_created_at_ttl",
+    )
+
+    await db["job_queue"].create_index(
+        [("status", ASCENDING), ("kind", ASCENDING), ("available_at", ASCENDING)],
+        name="idx_status_kind_available",
+    )
+    await db["job_queue"].create_index(
+        [("status", ASCENDING), ("lease_until", ASCENDING)],
+        name="idx_status_lease",
+    )
+    await db["job_queue"].create_index(
+        [("finished_at", ASCENDING)],
+        expireAfterSeconds=JOB_QUEUE_DONE_TTL,
+        name="idx_finished_at_ttl",
+    )
+
+    # Each draft carries its own expiry
+    await db["daily_share_drafts"].create_index(
+        [("expires_at", ASCENDING)], expireAfterSeconds=0, name="idx_expires_at_ttl"
+    )
+
+    await db["scheduler_windows"].create_index(
+        [("updated_at", ASCENDING)],
+        expireAfterSeconds=WINDOW_CURSOR_TTL,
+        name="idx_updated_at_ttl",
+    )
+
+    await db["scheduler_members"].create_index(
+        [("heartbeat_at", ASCENDING)],
+        expireAfterSeconds=3600,
+        name="idx_heartbeat_at_ttl",
+    )
+    await db["telegram_sender_members"].create_index(
+        [("heartbeat_at", ASCENDING)],
+        expireAfterSeconds=3600,
+        name="idx_heartbeat_at_ttl",
+    )
+
+    await db["intent_logs"].create_index(
+        [("created_at", DESCENDING)], name="idx_created_at"
+    )
+
+    await db["classification_cache"].create_index(
+        [("created_at", ASCENDING)],
+        expireAfterSeconds=CLASSIFICATION_CACHE_TTL,
+        name="idx_created_at_ttl",
+    )
+
     logger.info("[MongoDB] Indexes initialized.")
+
+
+async def run_migrations():
+    # Imported here to avoid a circular import with the migration helpers
+    from app.db.migrations import (
+        migrate_conversations_to_buckets,
+        backfill_user_shard_hash,
+    )
+
+    if db is None:
+        raise RuntimeError("Database not initialized")
+
+    migrated = await migrate_conversations_to_buckets(db)
+    if migrated:
+        print(f"[MongoDB] Migrated {migrated} conversations to daily buckets")
+
+    backfilled = await backfill_user_shard_hash(db)
+    if backfilled:
+        print(f"[MongoDB] Backfilled shard_hash on {backfilled} users")
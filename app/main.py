@@ -14,10 +14,28 @@ from app.utils.scheduler import (
     remind_user_tasks,
     daily_progress_creation,
     ask_daily_share,
+    pregenerate_daily_share,
     analyze_daily_sentiment,
+    retrain_intent_classifier,
+    start_job_workers,
+    stop_job_workers,
+    start_leader_election,
+    stop_leader_election,
 )
 import pytz
 from app.utils.bot_handler import router
+from app.services.llm_client import close_llm_clients
+from app.services.goals_service import DAILY_PROGRESS_MODE
+from app.utils.delivery_window import (
+    REMIND_WINDOWS,
+    DAILY_PROGRESS_WINDOW,
+    DAILY_SHARE_PREGEN_ENABLED,
+    DAILY_SHARE_PREGEN_WINDOW,
+    DAILY_SHARE_WINDOW,
+    MOOD_ANALYSIS_WINDOW,
+    warn_on_overlap,
+)
+from app.utils.loop_monitor import start_loop_monitor, stop_loop_monitor
 
 load_dotenv()
 
@@ -33,29 +51,48 @@ app.include_router(router)
 @app.on_event("startup")
 async def startup_event():
     tz = pytz.timezone("Asia/Jakarta")
+    start_loop_monitor()
     await connect_to_mongo()
     await configure_bot()
+    try:
+        await retrain_intent_classifier()
+    except ValueError as e:
+        print("[IntentClassifier] Using seed examples only:", e)
+    # Every replica registers the cron jobs, only the lease holder runs them
+    await start_leader_election()
     # scheduler.add_job(test_cron_job, CronTrigger(second="*/10"))
-    scheduler.add_job(remind_user_tasks, CronTrigger(hour=6, timezone=tz))
-    scheduler.add_job(remind_user_tasks, CronTrigger(hour=20, timezone=tz))
-    # scheduler.add_job(remind_user_tasks, CronTrigger(hour=9, minute=55, timezone=tz))
-    scheduler.add_job(remind_user_tasks, CronTrigger(hour=12, timezone=tz))
-    # scheduler.add_job(remind_user_tasks, CronTrigger(minute="*/1", timezone=tz))
-    scheduler.add_job(
-        daily_progress_creation,
-        CronTrigger(hour=0, timezone=tz),
-    )
-    scheduler.add_job(ask_daily_share, CronTrigger(hour=20, minute=00, timezone=tz))
-    scheduler.add_job(
-        analyze_daily_sentiment, CronTrigger(hour=1, minute=30, timezone=tz)
+    # Windows are in the users' local time: each job ticks in UTC and runs
+    # for the timezones whose local time starts a slot of the window
+    for window in REMIND_WINDOWS:
+        window.schedule(scheduler, remind_user_tasks)
+    if DAILY_PROGRESS_MODE == "eager":
+        DAILY_PROGRESS_WINDOW.schedule(scheduler, daily_progress_creation)
+    if DAILY_SHARE_PREGEN_ENABLED:
+        DAILY_SHARE_PREGEN_WINDOW.schedule(scheduler, pregenerate_daily_share)
+    DAILY_SHARE_WINDOW.schedule(scheduler, ask_daily_share)
+    MOOD_ANALYSIS_WINDOW.schedule(scheduler, analyze_daily_sentiment)
+    warn_on_overlap(
+        [
+            *REMIND_WINDOWS,
+            DAILY_SHARE_PREGEN_WINDOW,
+            DAILY_SHARE_WINDOW,
+            MOOD_ANALYSIS_WINDOW,
+        ]
     )
+    # Per-process: every replica keeps its own classifier up to date
+    scheduler.add_job(retrain_intent_classifier, CronTrigger(minute=15, timezone=tz))
     scheduler.start()
+    await start_job_workers()
 
 
 @app.on_event("shutdown")
 async def shutdown_event():
     scheduler.shutdown()
     print("[Scheduler] Shutdown")
+    await stop_job_workers()
+    await stop_leader_election()
+    await close_llm_clients()
+    stop_loop_monitor()
 
 
 @app.get("/")
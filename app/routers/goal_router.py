@@ -7,6 +7,11 @@ from app.utils.util_func import get_current_time
 from app.schemas.user_daily_progres_schema import UserDailyProgressCreate
 from app.services.goals_service import UserGoalService
 from app.utils.bot_handler import bot
+from app.utils.task_reminder import (
+    REMINDER_CONSOLIDATED,
+    render_task_reminder,
+    task_callback_data,
+)
 import asyncio
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 from app.services.scheduler_service import SchedulerService
@@ -38,6 +43,16 @@ async def find_today_tasks(
             goal_service.convert_tasks_list_reminder(),
             user_service.get_user_by_id(telegram_id),
         )
+        if REMINDER_CONSOLIDATED:
+            text, keyboard = render_task_reminder(user["first_name"], tasks)
+            await bot.send_message(
+                chat_id=int(telegram_id),
+                text=text,
+                reply_markup=keyboard,
+                parse_mode="Markdown",
+            )
+            return "OK"
+
         first_message = (
             f"👋 *Hi there {user["first_name"]}!*\n\n"
             "Here are your daily tasks. Please confirm your progress by selecting the appropriate action below each task.\n\n"
@@ -60,10 +75,15 @@ async def find_today_tasks(
                         [
                             InlineKeyboardButton(
                                 "✅ Complete",
-                                callback_data=f"complete:{task['task_id']}",
+                                callback_data=task_callback_data(
+                                    "complete", task["task_id"]
+                                ),
                             ),
                             InlineKeyboardButton(
-                                "⏭ Skip", callback_data=f"skip:{task['task_id']}"
+                                "⏭ Skip",
+                                callback_data=task_callback_data(
+                                    "skip", task["task_id"]
+                                ),
                             ),
                         ]
                     ]
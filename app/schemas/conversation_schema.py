@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import List, Literal, Optional
 from datetime import datetime
 
 
@@ -25,3 +25,23 @@ class Conversation(BaseModel):
 class Config:
     arbitrary_types_allowed = True
     json_encoders = {datetime: lambda dt: dt.isoformat()}
+
+
+Classification = Literal[
+    "greeting",
+    "ask_goal_suggestions",
+    "save_discussed_goals",
+    "daily_sharing",
+    "asking_bot_context",
+    "out_of_context",
+    "ask_sentiment",
+]
+
+
+class RuneReply(BaseModel):
+    classification: Classification = Field(
+        description="Classification of the user's query"
+    )
+    reply: str = Field(
+        description="Reply to the user. Empty for save_discussed_goals and ask_sentiment"
+    )
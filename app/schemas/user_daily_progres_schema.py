@@ -8,6 +8,7 @@ class UserTaskProgress(BaseModel):
     title: str
     completed: bool
     completed_at: Optional[datetime]
+    skipped: Optional[bool] = False
     notes: Optional[str]
 
 
@@ -35,6 +36,7 @@ class UserTaskProgressExtended(BaseModel):
     completion_unit: str
     completed: bool
     completed_at: Optional[datetime]
+    skipped: Optional[bool] = False
 
 
 class Config:
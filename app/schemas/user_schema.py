@@ -29,6 +29,7 @@ class UserBasicInfo(BaseModel):
     language: str
     level: Optional[int] = 1
     exp: Optional[int] = 0
+    timezone: Optional[str] = None
 
 
 class Config:
@@ -0,0 +1,121 @@
+from typing import List, Optional, Union
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from langchain.schema import AIMessage, HumanMessage
+from app.services.intent_classifier import normalize_text
+from app.utils.cache import TTLCache
+from app.utils.util_func import get_current_time
+import hashlib
+import asyncio
+import os
+
+CLASSIFICATION_CACHE_ENABLED = (
+    os.getenv("CLASSIFICATION_CACHE_ENABLED", "true").lower() == "true"
+)
+CLASSIFICATION_CACHE_SIZE = int(os.getenv("CLASSIFICATION_CACHE_SIZE", "5000"))
+CLASSIFICATION_CACHE_TTL = int(os.getenv("CLASSIFICATION_CACHE_TTL", "21600"))
+# Longer messages are almost never repeated, don't cache them
+CLASSIFICATION_CACHE_MAX_CHARS = int(os.getenv("CLASSIFICATION_CACHE_MAX_CHARS", "200"))
+# Number of trailing history messages that are part of the cache key
+CLASSIFICATION_CACHE_CONTEXT_MESSAGES = int(
+    os.getenv("CLASSIFICATION_CACHE_CONTEXT_MESSAGES", "2")
+)
+# Second tier shared by every process, entries expire through a TTL index
+CLASSIFICATION_CACHE_MONGO = (
+    os.getenv("CLASSIFICATION_CACHE_MONGO", "false").lower() == "true"
+)
+CLASSIFICATION_CACHE_COLLECTION = "classification_cache"
+
+_local_cache = TTLCache(CLASSIFICATION_CACHE_SIZE, CLASSIFICATION_CACHE_TTL)
+_mongo_hits = 0
+_background_tasks = set()
+
+
+def context_digest(messages: List[Union[AIMessage, HumanMessage]]) -> str:
+    """Digest of the last messages of the conversation window"""
+    recent = messages[-CLASSIFICATION_CACHE_CONTEXT_MESSAGES:] if messages else []
+    digest = hashlib.sha1()
+    for msg in recent:
+        digest.update(msg.type.encode())
+        digest.update(normalize_text(msg.content).encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class ClassificationCache:
+    """Classification results keyed on the normalized input and recent context.
+
+    Used by the two-step reply mode (LLM_SINGLE_CALL=false), where a hit
+    saves the classify call.
+    """
+
+    def __init__(self, db: AsyncIOMotorDatabase):
+        self.collection = db[CLASSIFICATION_CACHE_COLLECTION]
+
+    def make_key(
+        self, text: str, history: List[Union[AIMessage, HumanMessage]]
+    ) -> Optional[str]:
+        if not CLASSIFICATION_CACHE_ENABLED:
+            return None
+        normalized = normalize_text(text)
+        if not normalized or len(normalized) > CLASSIFICATION_CACHE_MAX_CHARS:
+            return None
+        text_hash = hashlib.sha1(normalized.encode()).hexdigest()
+        return f"{text_hash}:{context_digest(history)}"
+
+    async def get(self, key: Optional[str]) -> Optional[str]:
+        global _mongo_hits
+        if key is None:
+            return None
+
+        label = _local_cache.get(key)
+        if label is not None or not CLASSIFICATION_CACHE_MONGO:
+            return label
+
+        try:
+            doc = await self.collection.find_one({"_id": key}, {"label": 1})
+        except Exception as e:
+            print("CLASSIFICATION_CACHE_ERR", e)
+            return None
+        if doc is None:
+            return None
+
+        _mongo_hits += 1
+        _local_cache.set(key, doc["label"])
+        return doc["label"]
+
+    def set(self, key: Optional[str], label: str) -> None:
+        if key is None or not label:
+            return
+
+        _local_cache.set(key, label)
+        if not CLASSIFICATION_CACHE_MONGO:
+            return
+
+        async def run():
+            try:
+                await self.collection.update_one(
+                    {"_id": key},
+                    {
+                        "$set": {
+                            "label": label,
+                            "created_at": get_current_time("Asia/Jakarta"),
+                        }
+                    },
+                    upsert=True,
+                )
+            except Exception as e:
+                print("CLASSIFICATION_CACHE_ERR", e)
+
+        task = asyncio.create_task(run())
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+
+
+def classification_cache_stats() -> dict:
+    stats = _local_cache.stats()
+    # Every hit, local or shared, is a classify call that was not made
+    return {
+        **stats,
+        "mongo_hits": _mongo_hits,
+        "saved_llm_calls": stats["hits"] + _mongo_hits,
+    }
@@ -0,0 +1,45 @@
+from typing import Optional
+from datetime import timedelta
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from app.utils.util_func import get_current_time
+import os
+
+DAILY_SHARE_DRAFTS = "daily_share_drafts"
+# Drafts are generated hours ahead; an unsent one is useless the next day
+DAILY_SHARE_DRAFT_TTL = int(os.getenv("DAILY_SHARE_DRAFT_TTL", str(12 * 3600)))
+# Users drafted at the same time, bounded by the LLM rate limit
+DAILY_SHARE_PREGEN_CONCURRENCY = int(os.getenv("DAILY_SHARE_PREGEN_CONCURRENCY", "5"))
+
+
+class DailyShareDrafts:
+    """Daily share messages generated ahead of the send window, one per user per day"""
+
+    def __init__(self, db: AsyncIOMotorDatabase, date: str):
+        self.collection = db[DAILY_SHARE_DRAFTS]
+        self.date = date
+
+    def key(self, user_id: str) -> str:
+        return f"{user_id}:{self.date}"
+
+    async def get(self, user_id: str) -> Optional[str]:
+        doc = await self.collection.find_one({"_id": self.key(user_id)}, {"text": 1})
+        return doc["text"] if doc else None
+
+    async def save(self, user_id: str, text: str):
+        now = get_current_time()
+        await self.collection.update_one(
+            {"_id": self.key(user_id)},
+            {
+                "$set": {
+                    "user_id": user_id,
+                    "date": self.date,
+                    "text": text,
+                    "created_at": now,
+                    "expires_at": now + timedelta(seconds=DAILY_SHARE_DRAFT_TTL),
+                }
+            },
+            upsert=True,
+        )
+
+    async def delete(self, user_id: str):
+        await self.collection.delete_one({"_id": self.key(user_id)})
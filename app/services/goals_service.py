@@ -15,22 +15,91 @@ import json
 from app.utils.util_func import get_current_time
 import asyncio
 from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
 from bson import json_util
+from app.utils.cache import TTLCache
+from app.services.user_service import get_user_timezone
+import os
+
+# Goals change rarely but are read on every message, reminder and callback.
+# The cache is per process, the TTL bounds staleness across processes.
+GOALS_CACHE_SIZE = int(os.getenv("GOALS_CACHE_SIZE", "10000"))
+GOALS_CACHE_TTL = int(os.getenv("GOALS_CACHE_TTL", "300"))
+# eager: the midnight job creates every user's progress up front
+# lazy: today's progress is only created on first access (ensure_daily_progress)
+DAILY_PROGRESS_MODE = os.getenv("DAILY_PROGRESS_MODE", "eager").lower()
+
+# Stored for users without goals, so misses are cached too
+_NO_GOALS = object()
+_goals_cache = TTLCache(GOALS_CACHE_SIZE, GOALS_CACHE_TTL)
+_goals_text_cache = TTLCache(GOALS_CACHE_SIZE, GOALS_CACHE_TTL)
+
+
+def build_daily_progress(
+    telegram_id: str, date: str, daily_tasks: List[dict], now: datetime
+) -> dict:
+    """Fresh daily progress document, every task still open"""
+    tasks: List[UserTaskProgress] = []
+    for task in daily_tasks:
+        tasks.append(
+            UserTaskProgress(
+                task_id=task["id"],
+                title=task["title"],
+                completed=False,
+                completed_at=None,
+                skip_reason=None,
+                obstacles=None,
+                notes=None,
+            )
+        )
+
+    data = UserDailyProgress(
+        telegram_id=telegram_id,
+        date=date,
+        tasks=tasks,
+        overall_day_rating=None,
+        mood_after_tasks=None,
+        created_at=now,
+        updated_at=now,
+    )
+    return data.model_dump()
 
 
 class UserGoalService:
-    def __init__(self, db: AsyncIOMotorDatabase, telegram_id: str):
+    def __init__(
+        self,
+        db: AsyncIOMotorDatabase,
+        telegram_id: str,
+        tz_name: Optional[str] = None,
+    ):
         self.db = db
         self.goal_collection = db["users_goals"]
         self.progress_collection = db["daily_progress"]
         self.telegram_id = telegram_id
+        # Looked up on first use when the caller doesn't know it
+        self.tz_name = tz_name
+
+    async def local_now(self) -> datetime:
+        """Current time in the user's timezone, which decides what "today" is"""
+        if self.tz_name is None:
+            self.tz_name = await get_user_timezone(self.db, self.telegram_id)
+        return get_current_time(self.tz_name)
+
+    def invalidate_cache(self):
+        _goals_cache.delete(self.telegram_id)
+        _goals_text_cache.delete(self.telegram_id)
 
     async def load_goals(self):
+        """Read-through cached goals. The returned UserGoal is shared, don't mutate it"""
         try:
+            goals = _goals_cache.get(self.telegram_id)
+            if goals is not None:
+                return None if goals is _NO_GOALS else goals
+
             doc_goals = await self.goal_collection.find_one({"_id": self.telegram_id})
-            if not doc_goals:
-                return None
-            return UserGoal.model_validate(doc_goals)
+            goals = UserGoal.model_validate(doc_goals) if doc_goals else None
+            _goals_cache.set(self.telegram_id, goals or _NO_GOALS)
+            return goals
         except Exception as e:
             raise HTTPException(status_code=500, detail=str(e))
 
@@ -72,6 +141,8 @@ class UserGoalService:
             return doc
         except Exception as e:
             raise HTTPException(status_code=500, detail=str(e))
+        finally:
+            self.invalidate_cache()
 
     async def save_goals(self, goal: dict):
         try:
@@ -94,6 +165,8 @@ class UserGoalService:
             return "OK"
         except Exception as e:
             raise HTTPException(status_code=500, detail=str(e))
+        finally:
+            self.invalidate_cache()
 
     async def add_daily_task(self, title: str, note: str, min_required_completion: int):
         now = get_current_time("Asia/Jakarta")
@@ -113,6 +186,8 @@ class UserGoalService:
             )
         except Exception as e:
             raise HTTPException(status_code=500, detail=str(e))
+        finally:
+            self.invalidate_cache()
 
     async def update_daily_tasks(self, tasks: List[UserDailyTask]):
         now = get_current_time("Asia/Jakarta")
@@ -128,6 +203,8 @@ class UserGoalService:
             )
         except Exception as e:
             raise HTTPException(status_code=500, detail=str(e))
+        finally:
+            self.invalidate_cache()
 
     async def delete_goals(self):
         try:
@@ -135,6 +212,8 @@ class UserGoalService:
             return {"status": "deleted"}
         except Exception as e:
             raise HTTPException(status_code=500, detail=str(e))
+        finally:
+            self.invalidate_cache()
 
     async def save_complete_goal_to_db(self, goal_data: str) -> str:
         """Save complete goal with long-term goal and daily tasks to database"""
@@ -190,33 +269,38 @@ class UserGoalService:
     async def llm_load_goals(self, dummy_input: str = "") -> str:
         """LLM to load goals from db"""
         try:
-            goals = await self.load_goals()
-            if not goals:
-                return "No goals found. Ready to help you create your first long term goal!"
+            cached = _goals_text_cache.get(self.telegram_id)
+            if cached is not None:
+                return cached
 
-            result = "**Your currentt goals:**"
-            for goal in goals:
-                if goal["long_term_goal"]:
-                    result += (
-                        f"🎯 **Long-term Goal:** {goal["long_term_goal"]["summary"]}\n"
-                    )
-                    result += f"   Status: {goal["long_term_goal"]["status"]}\n"
-                    if goal["long_term_goal"]["target_date"]:
-                        result += f"   Target Date: {goal["long_term_goal"]["target_date"].strftime('%Y-%m-%d')}\n"
-                if goal["daily_tasks"]:
-                    result += f"   **Daily Tasks ({len(goal["daily_tasks"])}):**\n"
-                    for task in goal["daily_tasks"]:
-                        result += f"   • {task["title"]} (min: {task["min_required_completion"]}x)\n"
-                        if task["note"]:
-                            result += f"     Note: {task["note"]}\n"
-                result += "\n"
+            goals = await self.load_goals()
+            result = self.render_goals(goals)
+            _goals_text_cache.set(self.telegram_id, result)
             return result
         except Exception as e:
             return f"Error on retrieving goals {str(e)}"
 
+    def render_goals(self, goal: Optional[UserGoal]) -> str:
+        if not goal:
+            return "No goals found. Ready to help you create your first long term goal!"
+
+        result = "**Your current goals:**\n"
+        if goal.long_term_goal:
+            result += f"🎯 **Long-term Goal:** {goal.long_term_goal.summary}\n"
+            result += f"   Status: {goal.long_term_goal.status}\n"
+            if goal.long_term_goal.target_date:
+                result += f"   Target Date: {goal.long_term_goal.target_date.strftime('%Y-%m-%d')}\n"
+        if goal.daily_tasks:
+            result += f"   **Daily Tasks ({len(goal.daily_tasks)}):**\n"
+            for task in goal.daily_tasks:
+                result += f"   • {task.title} (min: {task.min_required_completion}x)\n"
+                if task.note:
+                    result += f"     Note: {task.note}\n"
+        return result
+
     async def add_progress(self, progress: UserTaskProgress) -> bool:
         try:
-            curr_date = get_current_time("Asia/Jakarta").strftime("%Y-%m-%d")
+            curr_date = (await self.local_now()).strftime("%Y-%m-%d")
             existing_doc = await self.progress_collection.find_one(
                 {
                     "telegram_id": self.telegram_id,
@@ -240,77 +324,55 @@ class UserGoalService:
 
     async def load_daily_tasks_list(self):
         try:
-            doc = await self.goal_collection.find_one({"_id": self.telegram_id})
-            if not doc:
+            goals = await self.load_goals()
+            if not goals:
                 return None
-            dicted = UserGoal(**doc).model_dump()
-            return dicted["daily_tasks"]
+            return goals.model_dump()["daily_tasks"]
         except Exception as e:
             raise ValueError(e)
 
     async def create_user_daily_progress(self):
+        """Create today's progress if needed. Safe to call concurrently"""
+        return await self.ensure_daily_progress()
+
+    async def ensure_daily_progress(self) -> Optional[dict]:
+        """Return today's progress, creating it atomically on first access.
+
+        None when the user has no daily tasks.
+        """
         try:
-            now = get_current_time("Asia/Jakarta")
+            now = await self.local_now()
             curr_date = now.strftime("%Y-%m-%d")
+            query = {"telegram_id": self.telegram_id, "date": curr_date}
 
             goals = await self.load_goals()
-            if not goals:
-                return None
-
-            if not goals.daily_tasks:
+            if not goals or not goals.daily_tasks:
                 return None
 
-            # check duplicate for current date:
-            find_dup = await self.progress_collection.find_one(
-                {"date": curr_date, "telegram_id": self.telegram_id}
+            data = build_daily_progress(
+                self.telegram_id, curr_date, goals.model_dump()["daily_tasks"], now
             )
-            if find_dup:
-                raise ValueError("DUPLICATE_ENTRY")
-
-            tasks: List[UserTaskProgress] = []
-            for task in goals.daily_tasks:
-                tasks.append(
-                    UserTaskProgress(
-                        task_id=task.id,
-                        title=task.title,
-                        completed=False,
-                        completed_at=None,
-                        skip_reason=None,
-                        obstacles=None,
-                        notes=None,
-                    )
+            try:
+                return await self.progress_collection.find_one_and_update(
+                    query,
+                    {"$setOnInsert": data},
+                    projection={"_id": 0},
+                    upsert=True,
+                    return_document=ReturnDocument.AFTER,
                 )
-
-            data = UserDailyProgress(
-                # _id=str(uuid.uuid4()),
-                telegram_id=self.telegram_id,
-                date=curr_date,
-                tasks=tasks,
-                overall_day_rating=None,
-                mood_after_tasks=None,
-                created_at=now,
-                updated_at=now,
-            )
-            print(data.model_dump())
-            await self.progress_collection.insert_one(data.model_dump())
-            return data.model_dump()
+            except DuplicateKeyError:
+                # A concurrent upsert inserted it first
+                return await self.progress_collection.find_one(query, {"_id": 0})
         except Exception as e:
-            print(e)
+            print("ENSURE_DAILY_PROGRESS_ERR", e)
             raise e
 
     async def load_progress_day_tasks(self):
         try:
-            curr_date = curr_date = get_current_time("Asia/Jakarta").strftime(
-                "%Y-%m-%d"
-            )
-            result = await self.progress_collection.find_one(
-                {"telegram_id": self.telegram_id, "date": curr_date},
-            )
-            if not result:
-                res_dict = await self.create_user_daily_progress()
-                return [task for task in res_dict["tasks"]]
-
-            res_dict = UserDailyProgress(**result).model_dump()
+            res_dict = await self.ensure_daily_progress()
+            if not res_dict:
+                return None
+            res_dict = UserDailyProgress(**res_dict).model_dump()
             return [task for task in res_dict["tasks"]]
         except Exception as e:
             raise ValueError(e)
@@ -331,6 +393,9 @@ class UserGoalService:
             extended: List[UserTaskProgressExtended] = []
             for progress in tasks_progress:
                 task = tasks_lookup.get(progress["task_id"])
+                if not task:
+                    # Task removed from the goals after today's progress was created
+                    continue
                 extended.append(
                     UserTaskProgressExtended(
                         task_id=task["id"],
@@ -340,6 +405,7 @@ class UserGoalService:
                         completion_unit=task["completion_unit"],
                         completed=progress["completed"],
                         completed_at=progress["completed_at"],
+                        skipped=progress.get("skipped") or False,
                     )
                 )
             return [task.model_dump() for task in extended]
@@ -350,29 +416,44 @@ class UserGoalService:
     async def update_daily_task(self, task_id: str, is_complete: bool):
         """Update daily task via Telegram callback.\n\nTODO: return doc and improve UI by displaying completed/skipped task name"""
         try:
-            now = get_current_time("Asia/Jakarta")
+            now = await self.local_now()
             date = now.strftime("%Y-%m-%d")
+            query = {
+                "telegram_id": self.telegram_id,
+                "date": date,
+                "tasks.task_id": task_id,
+            }
+            update = {
+                "$set": {
+                    "tasks.$.completed": is_complete,
+                    "tasks.$.completed_at": now if is_complete else None,
+                    "tasks.$.skipped": not is_complete,
+                    "updated_at": now,
+                }
+            }
             doc = await self.progress_collection.find_one_and_update(
-                {
-                    "telegram_id": self.telegram_id,
-                    "date": date,
-                    "tasks.task_id": task_id,
-                },
-                {
-                    "$set": {
-                        "tasks.$.completed": is_complete,
-                        "tasks.$.completed_at": now if is_complete else None,
-                        "updated_at": now,
-                    }
-                },
-                return_document=ReturnDocument.AFTER,
+                query, update, return_document=ReturnDocument.AFTER
             )
+            if doc is None:
+                # Today's progress may not exist yet in lazy mode
+                await self.ensure_daily_progress()
+                doc = await self.progress_collection.find_one_and_update(
+                    query, update, return_document=ReturnDocument.AFTER
+                )
             # return the updated task obj
             doc = UserDailyProgress(**doc)
             return [task for task in doc.tasks if task.task_id == task_id][0]
         except Exception as e:
             raise ValueError(e)
 
+    async def load_progress_by_date(self, date: str) -> Optional[dict]:
+        try:
+            return await self.progress_collection.find_one(
+                {"telegram_id": self.telegram_id, "date": date}, {"_id": 0}
+            )
+        except Exception as e:
+            raise ValueError(e)
+
     async def load_last_progresses(self, last_days: int = 3):
         """Load user progress on last n days. Returned Serialize format (JSON)"""
         try:
@@ -0,0 +1,256 @@
+from typing import Dict, List, Optional, Tuple
+from collections import defaultdict
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from app.utils.util_func import get_current_time
+import numpy as np
+import asyncio
+import zlib
+import re
+import os
+
+LOCAL_CLASSIFIER_ENABLED = (
+    os.getenv("LOCAL_CLASSIFIER_ENABLED", "true").lower() == "true"
+)
+# Minimum cosine similarity to the nearest example to answer locally
+LOCAL_CLASSIFIER_THRESHOLD = float(os.getenv("LOCAL_CLASSIFIER_THRESHOLD", "0.75"))
+# Minimum gap between the best and the second best label
+LOCAL_CLASSIFIER_MARGIN = float(os.getenv("LOCAL_CLASSIFIER_MARGIN", "0.15"))
+# Longer messages always go to the LLM
+LOCAL_CLASSIFIER_MAX_CHARS = int(os.getenv("LOCAL_CLASSIFIER_MAX_CHARS", "80"))
+# Labels that are safe to answer without the conversation context
+LOCAL_CLASSIFIER_LABELS = set(
+    os.getenv(
+        "LOCAL_CLASSIFIER_LABELS", "greeting,asking_bot_context,daily_sharing"
+    ).split(",")
+)
+LOCAL_CLASSIFIER_EXAMPLES_PER_LABEL = int(
+    os.getenv("LOCAL_CLASSIFIER_EXAMPLES_PER_LABEL", "300")
+)
+
+# Hand-written examples so the classifier works before any logs exist
+SEED_EXAMPLES: Dict[str, List[str]] = {
+    "greeting": [
+        "hi",
+        "hello",
+        "hey",
+        "hey there",
+        "hi rune",
+        "hello rune",
+        "good morning",
+        "good afternoon",
+        "good evening",
+        "halo",
+        "hai",
+        "pagi",
+        "selamat pagi",
+        "selamat siang",
+        "selamat sore",
+        "selamat malam",
+        "halo rune",
+    ],
+    "asking_bot_context": [
+        "what are you",
+        "who are you",
+        "what can you do",
+        "what is this app",
+        "what is rune",
+        "are you a bot",
+        "are you human",
+        "how do you work",
+        "kamu siapa",
+        "kamu apa",
+        "ini aplikasi apa",
+        "aplikasi apa ini",
+        "kamu bisa apa",
+        "rune itu apa",
+    ],
+    "daily_sharing": [
+        "today was good",
+        "today was a good day",
+        "today was tiring",
+        "i had a rough day",
+        "i feel great today",
+        "i feel tired today",
+        "i am so tired",
+        "i'm stressed",
+        "my day was great",
+        "i did my tasks today",
+        "hari ini capek banget",
+        "hari ini seru",
+        "hari ini melelahkan",
+        "aku lagi sedih",
+        "aku capek",
+    ],
+    "ask_goal_suggestions": [
+        "i want to lose weight",
+        "i want to learn spanish",
+        "help me set my goals",
+        "can you break down my goal",
+        "suggest daily tasks for my goal",
+        "aku mau belajar bahasa inggris",
+        "aku ingin menurunkan berat badan",
+    ],
+    "save_discussed_goals": [
+        "yes save it",
+        "ok save those tasks",
+        "i agree with the tasks",
+        "sounds good, set them",
+        "oke simpan",
+        "setuju",
+    ],
+    "ask_sentiment": [
+        "how am i doing",
+        "how is my progress",
+        "how have i been feeling lately",
+        "what is my mood so far",
+        "gimana progress aku",
+    ],
+    "out_of_context": [
+        "who won the match last night",
+        "tell me a joke",
+        "what's the weather",
+        "what is your favorite movie",
+        "siapa presiden amerika",
+    ],
+}
+
+
+def normalize_text(text: str) -> str:
+    text = re.sub(r"[^\w\s']", " ", (text or "").lower())
+    return re.sub(r"\s+", " ", text).strip()
+
+
+class LocalIntentClassifier:
+    """Nearest-example classifier over hashed character n-grams.
+
+    Each example is a L2-normalized bag of character 2-4 grams hashed into
+    `n_features` buckets, so a prediction is one matrix-vector product.
+    """
+
+    def __init__(self, n_features: int = 2048, ngram_range: Tuple[int, int] = (2, 4)):
+        self.n_features = n_features
+        self.ngram_range = ngram_range
+        self.labels: List[str] = []
+        self.example_labels = np.zeros(0, dtype=np.int32)
+        self.examples = np.zeros((0, n_features), dtype=np.float32)
+
+    def vectorize(self, text: str) -> np.ndarray:
+        vec = np.zeros(self.n_features, dtype=np.float32)
+        padded = f" {normalize_text(text)} "
+        for n in range(self.ngram_range[0], self.ngram_range[1] + 1):
+            for i in range(len(padded) - n + 1):
+                vec[zlib.crc32(padded[i : i + n].encode()) % self.n_features] += 1.0
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm else vec
+
+    def fit(self, texts: List[str], labels: List[str]) -> "LocalIntentClassifier":
+        self.labels = sorted(set(labels))
+        index = {label: i for i, label in enumerate(self.labels)}
+        self.examples = (
+            np.stack([self.vectorize(t) for t in texts])
+            if texts
+            else np.zeros((0, self.n_features), dtype=np.float32)
+        )
+        self.example_labels = np.array([index[l] for l in labels], dtype=np.int32)
+        return self
+
+    def scores(self, text: str) -> Dict[str, float]:
+        """Best similarity per label"""
+        if not len(self.examples):
+            return {}
+        sims = self.examples @ self.vectorize(text)
+        best = np.full(len(self.labels), -1.0, dtype=np.float32)
+        np.maximum.at(best, self.example_labels, sims)
+        return {label: float(best[i]) for i, label in enumerate(self.labels)}
+
+    def predict(
+        self,
+        text: str,
+        threshold: float = LOCAL_CLASSIFIER_THRESHOLD,
+        margin: float = LOCAL_CLASSIFIER_MARGIN,
+    ) -> Tuple[Optional[str], float]:
+        """Return (label, confidence), label is None when the LLM should decide"""
+        if len(text or "") > LOCAL_CLASSIFIER_MAX_CHARS:
+            return None, 0.0
+        ranked = sorted(self.scores(text).items(), key=lambda x: x[1], reverse=True)
+        if not ranked:
+            return None, 0.0
+
+        label, confidence = ranked[0]
+        runner_up = ranked[1][1] if len(ranked) > 1 else 0.0
+        if (
+            label not in LOCAL_CLASSIFIER_LABELS
+            or confidence < threshold
+            or confidence - runner_up < margin
+        ):
+            return None, confidence
+        return label, confidence
+
+
+def seed_training_set() -> Tuple[List[str], List[str]]:
+    texts, labels = [], []
+    for label, examples in SEED_EXAMPLES.items():
+        texts.extend(examples)
+        labels.extend([label] * len(examples))
+    return texts, labels
+
+
+# Process-wide instance, trained on the seeds until train_local_classifier runs
+local_classifier = LocalIntentClassifier().fit(*seed_training_set())
+_background_tasks = set()
+
+
+async def train_local_classifier(db: AsyncIOMotorDatabase) -> int:
+    """Retrain the process-wide classifier from seeds + logged LLM classifications"""
+    global local_classifier
+    texts, labels = seed_training_set()
+    per_label = defaultdict(int)
+
+    cursor = (
+        db["intent_logs"]
+        .find({}, {"text": 1, "label": 1})
+        .sort("created_at", -1)
+        .limit(LOCAL_CLASSIFIER_EXAMPLES_PER_LABEL * len(SEED_EXAMPLES))
+    )
+    async for doc in cursor:
+        if per_label[doc["label"]] >= LOCAL_CLASSIFIER_EXAMPLES_PER_LABEL:
+            continue
+        per_label[doc["label"]] += 1
+        texts.append(doc["text"])
+        labels.append(doc["label"])
+
+    # Pure-Python hashing of every example, keep it off the event loop
+    local_classifier = await asyncio.to_thread(
+        LocalIntentClassifier().fit, texts, labels
+    )
+    print(f"[IntentClassifier] Trained on {len(texts)} examples")
+    return len(texts)
+
+
+def classify_locally(text: str) -> Optional[str]:
+    if not LOCAL_CLASSIFIER_ENABLED:
+        return None
+    label, _ = local_classifier.predict(text)
+    return label
+
+
+def log_classification(db: AsyncIOMotorDatabase, text: str, label: str) -> None:
+    """Store an LLM classification as a future training example (fire and forget)"""
+    if not label or len(text or "") > LOCAL_CLASSIFIER_MAX_CHARS:
+        return
+
+    async def run():
+        try:
+            await db["intent_logs"].insert_one(
+                {
+                    "text": normalize_text(text),
+                    "label": label,
+                    "created_at": get_current_time("Asia/Jakarta"),
+                }
+            )
+        except Exception as e:
+            print("INTENT_LOG_ERR", e)
+
+    task = asyncio.create_task(run())
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
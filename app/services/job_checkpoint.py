@@ -0,0 +1,40 @@
+from typing import List, Optional, Set
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from app.utils.util_func import get_current_time
+import os
+
+JOB_CHECKPOINTS = "job_checkpoints"
+# Checkpoints only matter until the run is over, the TTL index removes them
+JOB_CHECKPOINT_TTL = int(os.getenv("JOB_CHECKPOINT_TTL", str(14 * 24 * 3600)))
+
+
+class JobCheckpoint:
+    """Per-user completion marks of one run of a batch job, e.g. ("mood_analysis", date)"""
+
+    def __init__(self, db: AsyncIOMotorDatabase, job: str, run_key: str):
+        self.collection = db[JOB_CHECKPOINTS]
+        self.job = job
+        self.run_key = run_key
+
+    async def done_ids(self, user_ids: Optional[List[str]] = None) -> Set[str]:
+        """Users done in this run, among `user_ids` when given"""
+        query = {"job": self.job, "run_key": self.run_key}
+        if user_ids is not None:
+            query["user_id"] = {"$in": user_ids}
+        ids = await self.collection.distinct("user_id", query)
+        return set(ids)
+
+    async def mark_done(self, user_id: str, status: str = "done"):
+        await self.collection.update_one(
+            {"_id": f"{self.job}:{self.run_key}:{user_id}"},
+            {
+                "$set": {
+                    "job": self.job,
+                    "run_key": self.run_key,
+                    "user_id": user_id,
+                    "status": status,
+                    "created_at": get_current_time("Asia/Jakarta"),
+                }
+            },
+            upsert=True,
+        )
@@ -0,0 +1,320 @@
+from typing import (
+    Any,
+    AsyncIterable,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    Optional,
+    Union,
+)
+from datetime import datetime, timedelta
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ASCENDING, ReturnDocument, UpdateOne
+from app.utils.util_func import get_current_time
+import traceback
+import asyncio
+import socket
+import pytz
+import os
+
+JOB_QUEUE = "job_queue"
+# Run the scheduled per-user work through the persistent queue
+JOB_QUEUE_ENABLED = os.getenv("JOB_QUEUE_ENABLED", "true").lower() == "true"
+JOB_QUEUE_WORKERS = int(os.getenv("JOB_QUEUE_WORKERS", "10"))
+# An item leased longer than this is considered lost and handed out again
+JOB_QUEUE_LEASE_SECONDS = int(os.getenv("JOB_QUEUE_LEASE_SECONDS", "300"))
+# A handler is cancelled before its lease runs out, so an item is never
+# re-leased while the first worker is still running it
+JOB_QUEUE_HANDLER_TIMEOUT = float(
+    os.getenv("JOB_QUEUE_HANDLER_TIMEOUT", str(JOB_QUEUE_LEASE_SECONDS * 0.8))
+)
+# How often expired leases with no attempts left are dead-lettered
+JOB_QUEUE_REAP_INTERVAL = float(os.getenv("JOB_QUEUE_REAP_INTERVAL", "60"))
+JOB_QUEUE_MAX_ATTEMPTS = int(os.getenv("JOB_QUEUE_MAX_ATTEMPTS", "5"))
+JOB_QUEUE_RETRY_DELAY = int(os.getenv("JOB_QUEUE_RETRY_DELAY", "30"))
+JOB_QUEUE_POLL_INTERVAL = float(os.getenv("JOB_QUEUE_POLL_INTERVAL", "1.0"))
+# An idle worker doubles its poll interval after each empty claim, up to this
+JOB_QUEUE_MAX_POLL_INTERVAL = float(os.getenv("JOB_QUEUE_MAX_POLL_INTERVAL", "10"))
+JOB_QUEUE_ENQUEUE_BATCH = int(os.getenv("JOB_QUEUE_ENQUEUE_BATCH", "500"))
+# Finished items are kept this long for inspection, dead ones until removed
+JOB_QUEUE_DONE_TTL = int(os.getenv("JOB_QUEUE_DONE_TTL", str(3 * 24 * 3600)))
+
+Handler = Callable[[dict], Awaitable[Any]]
+
+
+def is_expired(item: dict, now: datetime) -> bool:
+    """Whether the item is past its not_after (naive UTC when read from Mongo)"""
+    not_after = item.get("not_after")
+    if not_after is None:
+        return False
+    if not_after.tzinfo is None:
+        not_after = pytz.utc.localize(not_after)
+    return not_after <= now
+
+
+class JobQueue:
+    """Work items in Mongo, one per (kind, run, user).
+
+    Items move pending -> leased -> done. A failed item goes back to pending
+    with a delay until it reaches max_attempts, then it is marked dead. A
+    worker that dies loses its lease after JOB_QUEUE_LEASE_SECONDS and the
+    item is picked up again. An item claimed after its not_after is marked
+    expired instead of being run, so late work is never delivered stale.
+    """
+
+    def __init__(self, db: AsyncIOMotorDatabase):
+        self.collection = db[JOB_QUEUE]
+
+    async def enqueue_many(
+        self,
+        kind: str,
+        run_key: str,
+        items: Union[Iterable[dict], AsyncIterable[dict]],
+        max_attempts: int = JOB_QUEUE_MAX_ATTEMPTS,
+        not_after: Optional[datetime] = None,
+    ) -> int:
+        """Enqueue one item per payload. Idempotent per (kind, run_key, user).
+
+        Items not run by `not_after` are dropped as expired.
+        """
+        now = get_current_time("Asia/Jakarta")
+        enqueued = 0
+        ops = []
+
+        async def flush():
+            nonlocal enqueued, ops
+            if ops:
+                result = await self.collection.bulk_write(ops, ordered=False)
+                enqueued += result.upserted_count
+                ops = []
+
+        async def iterate():
+            if hasattr(items, "__aiter__"):
+                async for item in items:
+                    yield item
+            else:
+                for item in items:
+                    yield item
+
+        async for payload in iterate():
+            user_id = str(payload["telegram_id"])
+            ops.append(
+                UpdateOne(
+                    {"_id": f"{kind}:{run_key}:{user_id}"},
+                    {
+                        "$setOnInsert": {
+                            "kind": kind,
+                            "run_key": run_key,
+                            "user_id": user_id,
+                            "payload": payload,
+                            "status": "pending",
+                            "attempts": 0,
+                            "max_attempts": max_attempts,
+                            "available_at": now,
+                            "not_after": not_after,
+                            "created_at": now,
+                        }
+                    },
+                    upsert=True,
+                )
+            )
+            if len(ops) >= JOB_QUEUE_ENQUEUE_BATCH:
+                await flush()
+        await flush()
+
+        print(f"[JobQueue] {kind} {run_key} enqueued={enqueued}")
+        return enqueued
+
+    async def claim(self, worker_id: str, kinds: Iterable[str]) -> Optional[dict]:
+        now = get_current_time("Asia/Jakarta")
+        return await self.collection.find_one_and_update(
+            {
+                "kind": {"$in": list(kinds)},
+                "$or": [
+                    {"status": "pending", "available_at": {"$lte": now}},
+                    {
+                        "status": "leased",
+                        "lease_until": {"$lt": now},
+                        # Exhausted items are dead-lettered by reap_expired_leases
+                        "$expr": {"$lt": ["$attempts", "$max_attempts"]},
+                    },
+                ],
+            },
+            {
+                "$set": {
+                    "status": "leased",
+                    "leased_by": worker_id,
+                    "lease_until": now + timedelta(seconds=JOB_QUEUE_LEASE_SECONDS),
+                    "updated_at": now,
+                },
+                "$inc": {"attempts": 1},
+            },
+            sort=[("available_at", ASCENDING)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    async def complete(self, item: dict):
+        now = get_current_time("Asia/Jakarta")
+        await self.collection.update_one(
+            {"_id": item["_id"], "leased_by": item["leased_by"]},
+            {
+                "$set": {"status": "done", "finished_at": now, "updated_at": now},
+                "$unset": {"lease_until": ""},
+            },
+        )
+
+    async def expire(self, item: dict):
+        now = get_current_time("Asia/Jakarta")
+        await self.collection.update_one(
+            {"_id": item["_id"], "leased_by": item["leased_by"]},
+            {
+                "$set": {"status": "expired", "finished_at": now, "updated_at": now},
+                "$unset": {"lease_until": ""},
+            },
+        )
+
+    async def fail(self, item: dict, error: str):
+        now = get_current_time("Asia/Jakarta")
+        if item["attempts"] >= item["max_attempts"]:
+            update = {"status": "dead", "dead_at": now}
+        else:
+            # Linear backoff: 30s, 60s, 90s, ...
+            delay = JOB_QUEUE_RETRY_DELAY * item["attempts"]
+            update = {
+                "status": "pending",
+                "available_at": now + timedelta(seconds=delay),
+            }
+        await self.collection.update_one(
+            {"_id": item["_id"], "leased_by": item["leased_by"]},
+            {
+                "$set": {**update, "last_error": error[:2000], "updated_at": now},
+                "$unset": {"lease_until": ""},
+            },
+        )
+
+    async def reap_expired_leases(self) -> int:
+        """Dead-letter items whose last attempt lost its lease (hung or crashed)"""
+        now = get_current_time("Asia/Jakarta")
+        result = await self.collection.update_many(
+            {
+                "status": "leased",
+                "lease_until": {"$lt": now},
+                "$expr": {"$gte": ["$attempts", "$max_attempts"]},
+            },
+            {
+                "$set": {
+                    "status": "dead",
+                    "dead_at": now,
+                    "last_error": "lease expired on the last attempt",
+                    "updated_at": now,
+                },
+                "$unset": {"lease_until": ""},
+            },
+        )
+        return result.modified_count
+
+    async def requeue_dead(self, kind: Optional[str] = None) -> int:
+        """Give dead-lettered items a fresh set of attempts"""
+        query = {"status": "dead", **({"kind": kind} if kind else {})}
+        result = await self.collection.update_many(
+            query,
+            {
+                "$set": {
+                    "status": "pending",
+                    "attempts": 0,
+                    "available_at": get_current_time("Asia/Jakarta"),
+                },
+                "$unset": {"dead_at": ""},
+            },
+        )
+        return result.modified_count
+
+
+class JobWorkerPool:
+    """Drain the queue with `concurrency` workers in this process"""
+
+    def __init__(
+        self,
+        db: AsyncIOMotorDatabase,
+        handlers: Dict[str, Handler],
+        concurrency: int = JOB_QUEUE_WORKERS,
+    ):
+        self.queue = JobQueue(db)
+        self.handlers = handlers
+        self.concurrency = concurrency
+        self.worker_prefix = f"{socket.gethostname()}:{os.getpid()}"
+        self._tasks = []
+        self._stopping = asyncio.Event()
+
+    async def run_worker(self, worker_id: str):
+        poll_interval = JOB_QUEUE_POLL_INTERVAL
+        while not self._stopping.is_set():
+            try:
+                item = await self.queue.claim(worker_id, self.handlers.keys())
+            except Exception as e:
+                print("JOB_QUEUE_CLAIM_ERR", e)
+                item = None
+            if item is None:
+                try:
+                    await asyncio.wait_for(self._stopping.wait(), timeout=poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+                # An empty queue is polled less and less often
+                poll_interval = min(poll_interval * 2, JOB_QUEUE_MAX_POLL_INTERVAL)
+                continue
+            poll_interval = JOB_QUEUE_POLL_INTERVAL
+
+            if is_expired(item, get_current_time("Asia/Jakarta")):
+                print("JOB_QUEUE_ITEM_EXPIRED", item["_id"])
+                try:
+                    await self.queue.expire(item)
+                except Exception as e:
+                    print("JOB_QUEUE_EXPIRE_ERR", e)
+                continue
+
+            try:
+                await asyncio.wait_for(
+                    self.handlers[item["kind"]](item["payload"]),
+                    timeout=JOB_QUEUE_HANDLER_TIMEOUT,
+                )
+                await self.queue.complete(item)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print("JOB_QUEUE_ITEM_ERR", item["_id"], e)
+                try:
+                    await self.queue.fail(item, traceback.format_exc())
+                except Exception as fail_err:
+                    # The lease expires and the item is retried anyway
+                    print("JOB_QUEUE_FAIL_ERR", fail_err)
+
+    async def run_reaper(self):
+        while not self._stopping.is_set():
+            try:
+                reaped = await self.queue.reap_expired_leases()
+                if reaped:
+                    print(f"[JobQueue] Dead-lettered {reaped} expired leases")
+            except Exception as e:
+                print("JOB_QUEUE_REAP_ERR", e)
+            try:
+                await asyncio.wait_for(
+                    self._stopping.wait(), timeout=JOB_QUEUE_REAP_INTERVAL
+                )
+            except asyncio.TimeoutError:
+                pass
+
+    def start(self):
+        self._stopping.clear()
+        self._tasks = [
+            asyncio.create_task(self.run_worker(f"{self.worker_prefix}:{i}"))
+            for i in range(self.concurrency)
+        ]
+        self._tasks.append(asyncio.create_task(self.run_reaper()))
+        print(f"[JobQueue] Started {self.concurrency} workers")
+
+    async def stop(self):
+        self._stopping.set()
+        # Items in flight finish; unfinished ones are retried after their lease
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
@@ -0,0 +1,91 @@
+from typing import Optional
+from datetime import timedelta
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from app.utils.util_func import get_current_time
+import asyncio
+import socket
+import time
+import uuid
+import os
+
+LEASES = "leases"
+# A leader that stops renewing loses the lease after this many seconds
+LEADER_LEASE_TTL = int(os.getenv("LEADER_LEASE_TTL", "30"))
+LEADER_LEASE_RENEW_INTERVAL = float(os.getenv("LEADER_LEASE_RENEW_INTERVAL", "10"))
+
+
+class LeaderLease:
+    """Leader election over a Mongo document: {_id: name, holder, expires_at}.
+
+    Every replica runs `run()`; the one holding the unexpired lease is the
+    leader and renews it, the others retry and take over once it expires.
+    """
+
+    def __init__(self, db: AsyncIOMotorDatabase, name: str = "scheduler"):
+        self.collection = db[LEASES]
+        self.name = name
+        self.holder = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        # Monotonic deadline of our own lease, so a stalled renew can't keep us leader
+        self._valid_until = 0.0
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def is_leader(self) -> bool:
+        return time.monotonic() < self._valid_until
+
+    async def try_acquire(self) -> bool:
+        started = time.monotonic()
+        now = get_current_time("Asia/Jakarta")
+        try:
+            doc = await self.collection.find_one_and_update(
+                {
+                    "_id": self.name,
+                    "$or": [{"holder": self.holder}, {"expires_at": {"$lt": now}}],
+                },
+                {
+                    "$set": {
+                        "holder": self.holder,
+                        "expires_at": now + timedelta(seconds=LEADER_LEASE_TTL),
+                        "renewed_at": now,
+                    }
+                },
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+        except DuplicateKeyError:
+            # The lease exists and another replica holds it
+            doc = None
+
+        was_leader = self.is_leader
+        if doc and doc["holder"] == self.holder:
+            self._valid_until = started + LEADER_LEASE_TTL
+            if not was_leader:
+                print(f"[LeaderLease] {self.holder} is now leader of {self.name}")
+            return True
+
+        self._valid_until = 0.0
+        if was_leader:
+            print(f"[LeaderLease] {self.holder} lost leadership of {self.name}")
+        return False
+
+    async def run(self):
+        while True:
+            try:
+                await self.try_acquire()
+            except Exception as e:
+                print("LEADER_LEASE_ERR", e)
+            await asyncio.sleep(LEADER_LEASE_RENEW_INTERVAL)
+
+    def start(self):
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        if self.is_leader:
+            # Hand over right away instead of waiting for the lease to expire
+            self._valid_until = 0.0
+            await self.collection.delete_one({"_id": self.name, "holder": self.holder})
@@ -0,0 +1,129 @@
+from typing import Any, Dict, Optional, Tuple
+from langchain_core.runnables import Runnable
+from langchain_openai import ChatOpenAI
+import traceback
+import asyncio
+import httpx
+import os
+
+# Connection pool shared by every ChatOpenAI instance of the process
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+LLM_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "20"))
+LLM_KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "60"))
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+# What to do when a sync LLM call runs on the event loop thread: raise, warn or off
+LLM_BLOCKING_GUARD = os.getenv("LLM_BLOCKING_GUARD", "warn").lower()
+
+_http_async_client: Optional[httpx.AsyncClient] = None
+_http_client: Optional[httpx.Client] = None
+_models: Dict[Tuple[str, float], ChatOpenAI] = {}
+# Structured-output / tool-bound wrappers, so the tool schemas are built once
+_bound_models: Dict[Tuple[str, Any, str, float], Runnable] = {}
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=LLM_MAX_CONNECTIONS,
+        max_keepalive_connections=LLM_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=LLM_KEEPALIVE_EXPIRY,
+    )
+
+
+class BlockingLLMCallError(RuntimeError):
+    pass
+
+
+def _guard_blocking_request(request: httpx.Request):
+    """httpx request hook of the sync client: flag calls made from the event loop"""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return  # not on the event loop thread, e.g. inside asyncio.to_thread
+
+    message = (
+        f"Blocking LLM call to {request.url} on the event loop, "
+        "use ainvoke/astream instead of invoke/stream"
+    )
+    if LLM_BLOCKING_GUARD == "raise":
+        raise BlockingLLMCallError(message)
+    print("BLOCKING_LLM_CALL", message)
+    traceback.print_stack(limit=12)
+
+
+def get_http_async_client() -> httpx.AsyncClient:
+    global _http_async_client
+    if _http_async_client is None or _http_async_client.is_closed:
+        _http_async_client = httpx.AsyncClient(
+            limits=_limits(), timeout=httpx.Timeout(LLM_TIMEOUT)
+        )
+    return _http_async_client
+
+
+def get_http_client() -> httpx.Client:
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        event_hooks = (
+            {"request": [_guard_blocking_request]}
+            if LLM_BLOCKING_GUARD in ("raise", "warn")
+            else {}
+        )
+        _http_client = httpx.Client(
+            limits=_limits(),
+            timeout=httpx.Timeout(LLM_TIMEOUT),
+            event_hooks=event_hooks,
+        )
+    return _http_client
+
+
+def get_chat_model(model: str = "gpt-4o", temperature: float = 0.7) -> ChatOpenAI:
+    """Return the process-wide ChatOpenAI for (model, temperature)"""
+    key = (model, temperature)
+    llm = _models.get(key)
+    if llm is None:
+        llm = ChatOpenAI(
+            temperature=temperature,
+            model=model,
+            openai_api_key=os.getenv("OPENAI_API_KEY"),
+            http_client=get_http_client(),
+            http_async_client=get_http_async_client(),
+        )
+        _models[key] = llm
+    return llm
+
+
+def get_structured_chat_model(
+    schema: Any, model: str = "gpt-4o", temperature: float = 0.7
+) -> Runnable:
+    """Return the shared chat model wrapped with structured output for `schema`"""
+    key = ("structured", schema, model, temperature)
+    runnable = _bound_models.get(key)
+    if runnable is None:
+        runnable = get_chat_model(model, temperature).with_structured_output(
+            schema, method="function_calling"
+        )
+        _bound_models[key] = runnable
+    return runnable
+
+
+def get_tool_chat_model(
+    tool: Any, model: str = "gpt-4o", temperature: float = 0.7
+) -> Runnable:
+    """Return the shared chat model bound to the single tool `tool`"""
+    key = ("tools", tool, model, temperature)
+    runnable = _bound_models.get(key)
+    if runnable is None:
+        runnable = get_chat_model(model, temperature).bind_tools([tool])
+        _bound_models[key] = runnable
+    return runnable
+
+
+async def close_llm_clients():
+    global _http_async_client, _http_client
+    _models.clear()
+    _bound_models.clear()
+    if _http_async_client is not None:
+        await _http_async_client.aclose()
+        _http_async_client = None
+    if _http_client is not None:
+        _http_client.close()
+        _http_client = None
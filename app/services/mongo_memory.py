@@ -1,25 +1,57 @@
-from typing import List, Union
-from datetime import datetime
+from typing import List, Optional, Tuple, Union
+from datetime import datetime, timedelta
 from langchain.schema import BaseChatMessageHistory, HumanMessage, AIMessage
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from fastapi import HTTPException
 import pymongo
-from app.utils.util_func import get_current_time
+from app.utils.util_func import get_current_time, count_tokens, to_local_date
+from app.services.user_service import get_user_timezone
 from datetime import datetime
-import pytz
+import os
+import asyncio
+
+# Tail of the conversation sent to the LLM on every turn
+CHAT_HISTORY_WINDOW = int(os.getenv("CHAT_HISTORY_WINDOW", "30"))
+CHAT_HISTORY_MAX_TOKENS = int(os.getenv("CHAT_HISTORY_MAX_TOKENS", "2000"))
+CONVERSATION_BUCKETS = "conversation_buckets"
+# Mongo keeps millisecond precision; messages written together are this far
+# apart so their timestamps stay distinct and ordered (the summary folds by them)
+MESSAGE_TIMESTAMP_STEP = timedelta(milliseconds=1)
+# Bucket dates are local days of the timezone in use when they were written,
+# at most a day off the UTC date. After a timezone change, buckets up to this
+# many days apart can hold messages in either order
+BUCKET_DATE_SKEW_DAYS = 2
+
+
+def shift_date(date: str, days: int) -> str:
+    shifted = datetime.strptime(date, "%Y-%m-%d") + timedelta(days=days)
+    return shifted.strftime("%Y-%m-%d")
+
+
+def message_time(message: dict) -> datetime:
+    return message.get("timestamp") or datetime.min
 
 
 class ChatMemory(BaseChatMessageHistory):
-    def __init__(self, db: AsyncIOMotorDatabase, user_id: str):
+    def __init__(
+        self, db: AsyncIOMotorDatabase, user_id: str, tz_name: Optional[str] = None
+    ):
         # Create a sync MongoDB client for LangChain compatibility
         # Extract connection details from the async client
+        self.db = db
         self.user_id = user_id
+        # Buckets are per local day of the user, looked up on first use
+        self.tz_name = tz_name
         self._messages = []
+        self.window_start: Optional[datetime] = None
 
         # Create sync client using the same connection string
         # You'll need to pass the MongoDB connection string here
         # For now, we'll store the async db reference and create sync operations
+        # Conversation envelope (summary) keyed by user id
         self.async_collection = db["conversations"]
+        # Messages are stored in one bucket per user per day
+        self.bucket_collection = db[CONVERSATION_BUCKETS]
 
         # Create sync client (you'll need to modify this based on your MongoDB setup)
         # self.sync_client = pymongo.MongoClient(your_mongo_connection_string)
@@ -39,182 +71,321 @@ class ChatMemory(BaseChatMessageHistory):
         self._messages = []
 
     # Async methods for your application logic
+    def to_chat_messages(
+        self, raw_messages: List[dict]
+    ) -> List[Union[AIMessage, HumanMessage]]:
+        messages = []
+        for m in raw_messages:
+            # The stored timestamp lets save_messages_to_db keep the message's day
+            kwargs = {"timestamp": m["timestamp"]} if m.get("timestamp") else {}
+            if m["type"] == "human":
+                messages.append(
+                    HumanMessage(content=m["content"], additional_kwargs=kwargs)
+                )
+            elif m["type"] == "ai":
+                messages.append(
+                    AIMessage(content=m["content"], additional_kwargs=kwargs)
+                )
+        return messages
+
     async def load_messages_from_db(self) -> List[Union[AIMessage, HumanMessage]]:
         """Load messages from database and populate memory"""
-        doc = await self.async_collection.find_one({"_id": self.user_id})
-        if not doc or "messages" not in doc:
-            self._messages = []
-            return []
+        cursor = self.bucket_collection.find(
+            {"user_id": self.user_id}, {"messages": 1}
+        ).sort("date", pymongo.ASCENDING)
 
         messages = []
-        for m in doc["messages"]:
-            if m["type"] == "human":
-                messages.append(HumanMessage(content=m["content"]))
-            elif m["type"] == "ai":
-                messages.append(AIMessage(content=m["content"]))
+        async for bucket in cursor:
+            messages.extend(self.to_chat_messages(bucket.get("messages", [])))
 
         self._messages = messages
         return messages
 
-    # Alternative version using MongoDB aggregation for better performance
-    async def load_conversations_by_date(
-        self, date: str
+    async def load_recent_messages(
+        self,
+        limit: int = CHAT_HISTORY_WINDOW,
+        max_tokens: int = CHAT_HISTORY_MAX_TOKENS,
     ) -> List[Union[AIMessage, HumanMessage]]:
-        """
-        Load messages using MongoDB aggregation for better performance
-        """
-        try:
-            # Parse the input date and localize to Jakarta timezone
-            jakarta = pytz.timezone("Asia/Jakarta")
-            start_local = jakarta.localize(datetime.strptime(date, "%Y-%m-%d"))
-            end_local = jakarta.localize(
-                datetime.strptime(date, "%Y-%m-%d").replace(
-                    hour=23, minute=59, second=59, microsecond=999999
-                )
+        """Load only the last `limit` messages and trim them to `max_tokens`"""
+        # Walk the newest buckets first, each one already sliced to the window
+        cursor = (
+            self.bucket_collection.find(
+                {"user_id": self.user_id},
+                {"date": 1, "messages": {"$slice": -limit}},
             )
+            .sort("date", pymongo.DESCENDING)
+            .batch_size(2)
+        )
 
-            # Convert to UTC for MongoDB comparison
-            start_utc = start_local.astimezone(pytz.utc)
-            end_utc = end_local.astimezone(pytz.utc)
+        raw_messages = []
+        last_date = None
+        async for bucket in cursor:
+            if last_date is not None and bucket["date"] < last_date:
+                break
+            raw_messages.extend(bucket.get("messages", []))
+            if last_date is None and len(raw_messages) >= limit:
+                # Older buckets may still hold newer messages, see BUCKET_DATE_SKEW_DAYS
+                last_date = shift_date(bucket["date"], -BUCKET_DATE_SKEW_DAYS)
 
-            print(f"Querying messages between {start_utc} and {end_utc}")
+        raw_messages.sort(key=message_time)
+        raw_messages = raw_messages[-limit:]
+        messages = self.trim_messages_to_budget(
+            self.to_chat_messages(raw_messages), max_tokens
+        )
+        # Oldest message still in the window, anything before it is summarized
+        self.window_start = (
+            raw_messages[-len(messages)].get("timestamp") if messages else None
+        )
+        self._messages = messages
+        return messages
 
-            # Use aggregation to filter messages at database level
-            pipeline = [
-                {"$match": {"_id": self.user_id}},
-                {"$unwind": "$messages"},
-                {
-                    "$match": {
-                        "messages.timestamp": {"$gte": start_utc, "$lte": end_utc}
-                    }
-                },
-                {"$sort": {"messages.timestamp": 1}},  # Sort by timestamp
-                {"$project": {"message": "$messages"}},
-            ]
+    async def load_messages_between(
+        self,
+        after: Optional[datetime],
+        before: datetime,
+        limit: int,
+    ) -> List[dict]:
+        """Load up to `limit` raw messages with `after` < timestamp < `before`, oldest first"""
+        await self.local_now()
+        # Buckets written before a timezone change may be a day off, the
+        # timestamps below are exact
+        date_filter = {"$lte": self.to_local_date(before + timedelta(days=1))}
+        if after:
+            date_filter["$gte"] = self.to_local_date(after - timedelta(days=1))
 
-            cursor = self.async_collection.aggregate(pipeline)
-            results = await cursor.to_list(length=None)
+        cursor = self.bucket_collection.find(
+            {"user_id": self.user_id, "date": date_filter}, {"date": 1, "messages": 1}
+        ).sort("date", pymongo.ASCENDING)
+
+        result = []
+        last_date = None
+        async for bucket in cursor:
+            if last_date is not None and bucket["date"] > last_date:
+                break
+            for m in bucket.get("messages", []):
+                ts = m.get("timestamp")
+                if ts is None or ts >= before or (after and ts <= after):
+                    continue
+                result.append(m)
+            if last_date is None and len(result) >= limit:
+                # Newer buckets may still hold older messages, see BUCKET_DATE_SKEW_DAYS
+                last_date = shift_date(bucket["date"], BUCKET_DATE_SKEW_DAYS)
+
+        result.sort(key=message_time)
+        return result[:limit]
+
+    async def local_now(self) -> datetime:
+        if self.tz_name is None:
+            self.tz_name = await get_user_timezone(self.db, self.user_id)
+        return get_current_time(self.tz_name)
+
+    def to_local_date(self, ts: datetime) -> str:
+        """Bucket date of a stored timestamp (naive UTC from Mongo)"""
+        return to_local_date(ts, self.tz_name)
+
+    def trim_messages_to_budget(
+        self, messages: List[Union[AIMessage, HumanMessage]], max_tokens: int
+    ) -> List[Union[AIMessage, HumanMessage]]:
+        """Keep the newest messages that fit in the token budget (at least one)"""
+        kept = []
+        used = 0
+        for msg in reversed(messages):
+            tokens = count_tokens(msg.content)
+            if kept and used + tokens > max_tokens:
+                break
+            kept.append(msg)
+            used += tokens
+        kept.reverse()
+        return kept
 
-            messages = []
-            for result in results:
-                m = result["message"]
-                if m["type"] == "human":
-                    messages.append(HumanMessage(content=m["content"]))
-                elif m["type"] == "ai":
-                    messages.append(AIMessage(content=m["content"]))
+    async def load_conversations_by_date(
+        self, date: str
+    ) -> List[Union[AIMessage, HumanMessage]]:
+        """
+        Load messages of one local day of the user with a point lookup on its bucket
+        """
+        try:
+            bucket = await self.bucket_collection.find_one(
+                {"user_id": self.user_id, "date": date}, {"messages": 1}
+            )
+            if not bucket:
+                print(f"Found 0 messages for date {date}")
+                return []
 
+            messages = self.to_chat_messages(bucket.get("messages", []))
             print(f"Found {len(messages)} messages for date {date}")
             return messages
 
         except Exception as e:
-            print(f"Error in load_conversations_by_date_optimized: {e}")
+            print(f"Error in load_conversations_by_date: {e}")
             return []
 
     async def save_messages_to_db(self) -> None:
-        """Save current messages to database"""
-        now = get_current_time("Asia/Jakarta")
+        """Save current messages to database, replacing the stored history.
+
+        Loaded messages go back to the bucket of their own day, new ones
+        (without a stored timestamp) to today's.
+        """
+        now = await self.local_now()
         if not self._messages:
             return
 
-        # Convert messages to dict format
-        message_dicts = []
-        for msg in self._messages:
-            message_dicts.append(
+        # Convert messages to dict format, grouped by bucket date
+        buckets = {}
+        for i, msg in enumerate(self._messages):
+            ts = (
+                msg.additional_kwargs.get("timestamp")
+                or now + i * MESSAGE_TIMESTAMP_STEP
+            )
+            buckets.setdefault(self.to_local_date(ts), []).append(
                 {
                     "type": "human" if isinstance(msg, HumanMessage) else "ai",
                     "content": msg.content,
-                    "timestamp": now,
+                    "timestamp": ts,
                 }
             )
 
-        # Check if conversation exists
-        doc = await self.async_collection.find_one({"_id": self.user_id})
-        if not doc:
-            # Create new conversation
-            await self.async_collection.insert_one(
+        await self.bucket_collection.delete_many({"user_id": self.user_id})
+        await self.bucket_collection.insert_many(
+            [
                 {
-                    "_id": self.user_id,
-                    "summary": None,
+                    "user_id": self.user_id,
+                    "date": date,
                     "messages": message_dicts,
+                    "message_count": len(message_dicts),
                     "created_at": now,
                     "updated_at": now,
                 }
-            )
-        else:
-            # Update existing conversation
-            await self.async_collection.update_one(
-                {"_id": self.user_id},
-                {
-                    "$set": {
-                        "messages": message_dicts,
-                        "updated_at": now,
-                    }
-                },
-            )
+                for date, message_dicts in sorted(buckets.items())
+            ]
+        )
 
     async def add_message_to_db(self, message: Union[HumanMessage, AIMessage]) -> None:
-        """Add a single message to database"""
-        now = get_current_time("Asia/Jakarta")
-        doc = await self.async_collection.find_one({"_id": self.user_id})
-        if not doc:
-            await self.async_collection.insert_one(
-                {
-                    "_id": self.user_id,
-                    "summary": None,
-                    "messages": [],
-                    "created_at": now,
-                    "updated_at": now,
-                }
-            )
+        """Add a single message to today's bucket"""
+        await self.add_messages_to_db([message])
 
-        await self.async_collection.update_one(
-            {"_id": self.user_id},
+    async def add_turn_to_db(self, query: str, reply: str) -> None:
+        """Persist one conversation turn (user query + Rune reply) in one round trip"""
+        await self.add_messages_to_db(
+            [HumanMessage(content=query), AIMessage(content=reply)]
+        )
+
+    async def add_messages_to_db(
+        self, messages: List[Union[HumanMessage, AIMessage]]
+    ) -> None:
+        """Append messages to today's bucket with a single upsert"""
+        if not messages:
+            return
+
+        now = await self.local_now()
+        await self.bucket_collection.update_one(
+            {"user_id": self.user_id, "date": now.strftime("%Y-%m-%d")},
             {
                 "$push": {
                     "messages": {
-                        "type": "human" if isinstance(message, HumanMessage) else "ai",
-                        "content": message.content,
-                        "timestamp": now,
+                        "$each": [
+                            {
+                                "type": (
+                                    "human" if isinstance(msg, HumanMessage) else "ai"
+                                ),
+                                "content": msg.content,
+                                "timestamp": now + i * MESSAGE_TIMESTAMP_STEP,
+                            }
+                            for i, msg in enumerate(messages)
+                        ]
                     }
-                }
+                },
+                "$inc": {"message_count": len(messages)},
+                "$set": {"updated_at": now},
+                "$setOnInsert": {"created_at": now},
             },
+            upsert=True,
         )
 
-    async def update_summary(self, summary: str):
+    async def update_summary(
+        self,
+        summary: str,
+        summarized_until: Optional[datetime] = None,
+        expected_until: Optional[datetime] = None,
+    ) -> bool:
+        """Store the rolling summary.
+
+        When `summarized_until` is given the write only succeeds if the stored
+        marker still equals `expected_until`, so two concurrent summarizations
+        can't fold the same messages twice.
+        """
+        now = get_current_time("Asia/Jakarta")
+        if summarized_until is None:
+            await self.async_collection.update_one(
+                {"_id": self.user_id},
+                {"$set": {"summary": summary, "updated_at": now}},
+                upsert=True,
+            )
+            return True
+
         await self.async_collection.update_one(
             {"_id": self.user_id},
+            {
+                "$setOnInsert": {
+                    "summary": None,
+                    "summarized_until": None,
+                    "created_at": now,
+                }
+            },
+            upsert=True,
+        )
+        result = await self.async_collection.update_one(
+            {"_id": self.user_id, "summarized_until": expected_until},
             {
                 "$set": {
                     "summary": summary,
-                    "updated_at": get_current_time("Asia/Jakarta"),
+                    "summarized_until": summarized_until,
+                    "updated_at": now,
                 }
             },
-            upsert=True,
         )
+        return result.modified_count > 0
 
     async def get_summary(self) -> str:
-        doc = await self.async_collection.find_one({"_id": self.user_id})
-        return doc.get("summary", "") if doc else ""
+        doc = await self.async_collection.find_one(
+            {"_id": self.user_id}, {"summary": 1}
+        )
+        return (doc.get("summary") or "") if doc else ""
+
+    async def get_summary_state(self) -> Tuple[str, Optional[datetime]]:
+        """Return the stored summary and the timestamp of the last folded message"""
+        doc = await self.async_collection.find_one(
+            {"_id": self.user_id}, {"summary": 1, "summarized_until": 1}
+        )
+        if not doc:
+            return "", None
+        return doc.get("summary") or "", doc.get("summarized_until")
 
     async def clear_db(self):
-        await self.async_collection.delete_one({"_id": self.user_id})
+        await asyncio.gather(
+            self.async_collection.delete_one({"_id": self.user_id}),
+            self.bucket_collection.delete_many({"user_id": self.user_id}),
+        )
 
     def format_history_for_prompt(
         self,
         messages: List[Union[AIMessage, HumanMessage]],
+        summary: str = "",
     ) -> str:
-        """Convert message history to a safe string format for prompts"""
+        """Convert message history to a plain string for the prompt variables"""
+        formatted_history = []
+        if summary:
+            formatted_history.append(f"Summary of earlier conversation: {summary}")
+
         if not messages:
-            return "No previous conversation history."
+            formatted_history.append("No previous conversation history.")
+            return "\n".join(formatted_history)
 
-        formatted_history = []
         for msg in messages:
+            # Sent as message content, not a template: braces need no escaping
             if isinstance(msg, HumanMessage):
-                # Escape curly braces and format safely
-                content = msg.content.replace("{", "{{").replace("}", "}}")
-                formatted_history.append(f"User: {content}")
+                formatted_history.append(f"User: {msg.content}")
             elif isinstance(msg, AIMessage):
-                content = msg.content.replace("{", "{{").replace("}", "}}")
-                formatted_history.append(f"Rune: {content}")
+                formatted_history.append(f"Rune: {msg.content}")
 
         return "\n".join(formatted_history)
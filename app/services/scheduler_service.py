@@ -1,124 +1,369 @@
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from app.schemas.user_schema import UserBasicInfo
-from typing import List
-from app.services.goals_service import UserGoalService
+from typing import List, Optional
+from app.services.goals_service import UserGoalService, build_daily_progress
 from app.services.user_service import UserService
+from app.services.job_checkpoint import JobCheckpoint
+from app.services.job_queue import JOB_QUEUE_ENABLED, JobQueue
+from app.services.daily_share_drafts import (
+    DAILY_SHARE_PREGEN_CONCURRENCY,
+    DailyShareDrafts,
+)
 from app.utils.bot_handler import bot
+from app.utils.telegram_dispatcher import dispatcher, run_bounded
+from app.utils.task_reminder import (
+    REMINDER_CONSOLIDATED,
+    render_task_reminder,
+    task_callback_data,
+)
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 import asyncio
 from app.services.llm_service import LLMService
-from app.utils.util_func import get_current_time
+from app.utils.util_func import end_of_local_day, get_current_time
 from datetime import datetime, timedelta
+from pymongo.errors import BulkWriteError
+import os
+
+DAILY_PROGRESS_BATCH_SIZE = int(os.getenv("DAILY_PROGRESS_BATCH_SIZE", "1000"))
+# Users analyzed at the same time, bounded by the LLM rate limit
+MOOD_ANALYSIS_CONCURRENCY = int(os.getenv("MOOD_ANALYSIS_CONCURRENCY", "10"))
+# Active users are read and checked against the checkpoints this many at a time
+MOOD_ANALYSIS_PAGE_SIZE = int(os.getenv("MOOD_ANALYSIS_PAGE_SIZE", "1000"))
 
 
 class SchedulerService:
-    def __init__(self, db: AsyncIOMotorDatabase):
+    def __init__(
+        self,
+        db: AsyncIOMotorDatabase,
+        user_filter: Optional[dict] = None,
+        deadline: Optional[datetime] = None,
+    ):
         self.db = db
+        # Restricts the jobs to the users of a timezone, delivery slot or shard
+        self.user_filter = user_filter or {}
+        # Queued deliveries not sent by then expire, by default at local midnight
+        self.deadline = deadline
         # self.goal_collection = db["users_goals"]
         # self.progress_collection = db["daily_progress"]
         self.user_collection = db["users"]
 
-    async def remind_daily_tasks(self):
+    def job_handlers(self):
+        """Per-user handlers of the work items enqueued by the jobs below"""
+        return {
+            "remind_tasks": self.remind_user,
+            "daily_share_draft": self.draft_for_user,
+            "daily_share": self.share_with_user,
+            "mood_analysis": self.analyze_user_mood,
+        }
+
+    async def remind_daily_tasks(self, now: Optional[datetime] = None):
         try:
             user_service = UserService(self.db)
-            user_list = await user_service.find_all()
-
-            for user in user_list:
-                tg_id = str(user["telegram_id"])
-                print("USER ON PROCESS ", tg_id)
-                user_goal_service = UserGoalService(self.db, tg_id)
-                tasks = await user_goal_service.convert_tasks_list_reminder()
-                first_message = (
-                    f"👋 *Hi there {user["first_name"]}!*\n\n"
-                    "Here are your daily tasks. Please confirm your progress by selecting the appropriate action below each task.\n\n"
-                    "_Note: These reminder won’t appear in Rune chat history_"
-                )
-                await bot.send_message(
-                    chat_id=int(tg_id),
-                    text=first_message,
-                    parse_mode="Markdown",
+            now = now or get_current_time()
+            roster = user_service.iter_reminder_roster(
+                now.strftime("%Y-%m-%d"), filters=self.user_filter
+            )
+            if JOB_QUEUE_ENABLED:
+                # Reminders run several times a day, one run per hour slot
+                return await JobQueue(self.db).enqueue_many(
+                    "remind_tasks",
+                    now.strftime("%Y-%m-%dT%H"),
+                    roster,
+                    not_after=self.deadline or end_of_local_day(now),
                 )
-                # Send each task with 0.5s delay
-                for i, task in enumerate(tasks, 1):
-                    if not task["completed"]:
-                        keyboard = InlineKeyboardMarkup(
-                            [
-                                [
-                                    InlineKeyboardButton(
-                                        "✅ Complete",
-                                        callback_data=f"complete:{task['task_id']}",
-                                    ),
-                                    InlineKeyboardButton(
-                                        "⏭ Skip",
-                                        callback_data=f"skip:{task['task_id']}",
-                                    ),
-                                ]
-                            ]
-                        )
-                        message = (
-                            f"*📝 Task {i}:* {task['title']}\n"
-                            f"🗒️ _{task['note']}_\n"
-                            f"🔢 *Minimum required:* {task['min_required_completion']} {task['completion_unit']}"
-                        )
-                    else:
-                        message = (
-                            f"*📝 Task {i}:* {task['title']}\n"
-                            f"🗒️ _{task['note']}_\n"
-                            f"🔢 *Minimum required:* {task['min_required_completion']} {task['completion_unit']}"
-                            f"✅ _Task Already Completed_"
-                        )
-                        keyboard = None
-                    await bot.send_message(
-                        chat_id=int(user["telegram_id"]),
-                        text=message,
-                        reply_markup=keyboard,
-                        parse_mode="Markdown",
-                    )
-                    await asyncio.sleep(0.5)
+            return await run_bounded(roster, self.remind_user, name="REMIND")
         except Exception as e:
             print("REMIND_ERR ", e)
             raise ValueError(e)
 
-    async def daily_progress_creation(self):
+    async def remind_user(self, user: dict):
+        """Send one roster payload: {telegram_id, first_name, tasks}"""
+        tg_id = str(user["telegram_id"])
+        print("USER ON PROCESS ", tg_id)
+        tasks = user["tasks"]
+        if REMINDER_CONSOLIDATED:
+            text, keyboard = render_task_reminder(user["first_name"], tasks)
+            await dispatcher.send_message(
+                int(tg_id), text=text, reply_markup=keyboard, parse_mode="Markdown"
+            )
+            return
+
+        first_message = (
+            f"👋 *Hi there {user["first_name"]}!*\n\n"
+            "Here are your daily tasks. Please confirm your progress by selecting the appropriate action below each task.\n\n"
+            "_Note: These reminder won’t appear in Rune chat history_"
+        )
+        await dispatcher.send_message(
+            int(tg_id), text=first_message, parse_mode="Markdown"
+        )
+        # Messages of one chat are paced by the dispatcher
+        for i, task in enumerate(tasks, 1):
+            if not task["completed"]:
+                keyboard = InlineKeyboardMarkup(
+                    [
+                        [
+                            InlineKeyboardButton(
+                                "✅ Complete",
+                                callback_data=task_callback_data(
+                                    "complete", task["task_id"]
+                                ),
+                            ),
+                            InlineKeyboardButton(
+                                "⏭ Skip",
+                                callback_data=task_callback_data(
+                                    "skip", task["task_id"]
+                                ),
+                            ),
+                        ]
+                    ]
+                )
+                message = (
+                    f"*📝 Task {i}:* {task['title']}\n"
+                    f"🗒️ _{task['note']}_\n"
+                    f"🔢 *Minimum required:* {task['min_required_completion']} {task['completion_unit']}"
+                )
+            else:
+                message = (
+                    f"*📝 Task {i}:* {task['title']}\n"
+                    f"🗒️ _{task['note']}_\n"
+                    f"🔢 *Minimum required:* {task['min_required_completion']} {task['completion_unit']}"
+                    f"✅ _Task Already Completed_"
+                )
+                keyboard = None
+            await dispatcher.send_message(
+                int(tg_id),
+                text=message,
+                reply_markup=keyboard,
+                parse_mode="Markdown",
+            )
+
+    async def daily_progress_creation(self, now: Optional[datetime] = None):
+        """Create today's progress for every user with daily tasks, in bulk.
+
+        Users with goals are streamed and progress is written with unordered
+        insert_many batches; users that already have today's progress are
+        skipped by the unique (telegram_id, date) index.
+        """
         try:
+            now = now or get_current_time()
+            curr_date = now.strftime("%Y-%m-%d")
+            progress_collection = self.db["daily_progress"]
             user_service = UserService(self.db)
-            user_list = await user_service.find_all()
-            for user in user_list:
-                tg_id = str(user["telegram_id"])
-                goal_service = UserGoalService(self.db, tg_id)
-                await goal_service.create_user_daily_progress()
+            users = user_service.iter_users(
+                fields=["telegram_id"],
+                filters=self.user_filter,
+                only_with_goals=True,
+                batch_size=DAILY_PROGRESS_BATCH_SIZE,
+            )
+
+            stats = {"inserted": 0, "existing": 0}
+
+            async def flush(batch: List[dict]):
+                try:
+                    result = await progress_collection.insert_many(batch, ordered=False)
+                    stats["inserted"] += len(result.inserted_ids)
+                except BulkWriteError as e:
+                    errors = e.details.get("writeErrors", [])
+                    if any(err.get("code") != 11000 for err in errors):
+                        raise
+                    stats["inserted"] += e.details.get("nInserted", 0)
+                    stats["existing"] += len(errors)
+
+            batch = []
+            async for user in users:
+                batch.append(
+                    build_daily_progress(
+                        str(user["telegram_id"]), curr_date, user["daily_tasks"], now
+                    )
+                )
+                if len(batch) >= DAILY_PROGRESS_BATCH_SIZE:
+                    await flush(batch)
+                    batch = []
+            if batch:
+                await flush(batch)
+
+            print(
+                f"[DailyProgress] {curr_date} inserted={stats['inserted']} existing={stats['existing']}"
+            )
             return "OK"
         except Exception as e:
             print("DAILY_PROGRESS_CREATION ERR", e)
             raise ValueError(e)
 
-    async def ask_daily_share(self):
+    async def pregenerate_daily_share(self, now: Optional[datetime] = None):
+        """Generate today's daily share messages ahead of the send window.
+
+        Users that already have a draft for the day are skipped, so a rerun
+        only generates the missing ones.
+        """
         try:
-            user_service = UserService(self.db)
-            user_list = await user_service.find_all()
-            for user in user_list:
-                llm_service = LLMService(self.db, str(user["telegram_id"]))
-                text = await llm_service.ask_daily_sharing(user["first_name"])
-                await bot.send_message(
-                    chat_id=int(user["telegram_id"]),
-                    text=text,
-                    parse_mode="Markdown",
+            now = now or get_current_time()
+            date = now.strftime("%Y-%m-%d")
+
+            async def users_with_date():
+                user_service = UserService(self.db)
+                async for user in user_service.iter_users_without_draft(
+                    date, filters=self.user_filter
+                ):
+                    yield {
+                        "telegram_id": user["telegram_id"],
+                        "first_name": user["first_name"],
+                        "date": date,
+                    }
+
+            if JOB_QUEUE_ENABLED:
+                await JobQueue(self.db).enqueue_many(
+                    "daily_share_draft",
+                    date,
+                    users_with_date(),
+                    not_after=self.deadline or end_of_local_day(now),
+                )
+                return "OK"
+            await run_bounded(
+                users_with_date(),
+                self.draft_for_user,
+                concurrency=DAILY_SHARE_PREGEN_CONCURRENCY,
+                name="DAILY_SHARE_DRAFT",
+            )
+            return "OK"
+        except Exception as e:
+            print("PREGENERATE_DAILY_SHARE_ERR", e)
+            raise ValueError(e)
+
+    async def draft_for_user(self, user: dict):
+        """Generate and store one user's daily share message of user["date"]"""
+        tg_id = str(user["telegram_id"])
+        drafts = DailyShareDrafts(self.db, user["date"])
+        if await drafts.get(tg_id) is not None:
+            return
+        llm_service = LLMService(self.db, tg_id)
+        text = await llm_service.generate_daily_share(user["first_name"])
+        await drafts.save(tg_id, text)
+
+    async def ask_daily_share(self, now: Optional[datetime] = None):
+        try:
+            now = now or get_current_time()
+            date = now.strftime("%Y-%m-%d")
+
+            async def users_with_date():
+                user_service = UserService(self.db)
+                async for user in user_service.iter_users(filters=self.user_filter):
+                    yield {
+                        "telegram_id": user["telegram_id"],
+                        "first_name": user["first_name"],
+                        "date": date,
+                    }
+
+            if JOB_QUEUE_ENABLED:
+                await JobQueue(self.db).enqueue_many(
+                    "daily_share",
+                    date,
+                    users_with_date(),
+                    not_after=self.deadline or end_of_local_day(now),
                 )
+                return "OK"
+            await run_bounded(
+                users_with_date(), self.share_with_user, name="DAILY_SHARE"
+            )
             return "OK"
         except Exception as e:
             print("ASK_DAILY_SHARE_SCHED_ERR", e)
             raise ValueError(e)
 
-    async def analyze_daily_sentiment(self):
+    async def share_with_user(self, user: dict):
+        """Send the pre-generated message, generating it now if there is none"""
+        tg_id = str(user["telegram_id"])
+        llm_service = LLMService(self.db, tg_id)
+        # Items enqueued before drafts existed carry no date
+        drafts = DailyShareDrafts(self.db, user["date"]) if user.get("date") else None
+        text = await drafts.get(tg_id) if drafts else None
+        if text is None:
+            print("DAILY_SHARE_DRAFT_MISS", tg_id)
+            text = await llm_service.generate_daily_share(user["first_name"])
+        await dispatcher.send_message(int(tg_id), text=text, parse_mode="Markdown")
+        await llm_service.record_daily_share(text)
+        if drafts:
+            await drafts.delete(tg_id)
+
+    async def analyze_daily_sentiment(self, now: Optional[datetime] = None):
+        """Analyze yesterday's mood of every user who talked to Rune that day.
+
+        Runs with bounded concurrency and checkpoints each user, so a rerun
+        only processes the users that are not done yet.
+        """
         try:
-            user_service = UserService(self.db)
-            user_list = await user_service.find_all()
-            for user in user_list:
-                llm_service = LLMService(self.db, str(user["telegram_id"]))
-                yesterday = get_current_time("Asia/Jakarta") - timedelta(days=1)
-                result = await llm_service.get_mood_sentiment(
-                    user["first_name"], yesterday
+            now = now or get_current_time()
+            yesterday = now - timedelta(days=1)
+            date = yesterday.strftime("%Y-%m-%d")
+            checkpoint = JobCheckpoint(self.db, "mood_analysis", date)
+            counts = {"active": 0, "pending": 0}
+
+            async def users_with_date():
+                # Mood analysis needs goals, skip users without them
+                user_service = UserService(self.db)
+                async for page in self.iter_active_user_pages(date):
+                    done_ids = await checkpoint.done_ids(page)
+                    pending = [uid for uid in page if uid not in done_ids]
+                    counts["active"] += len(page)
+                    counts["pending"] += len(pending)
+                    if not pending:
+                        continue
+                    async for user in user_service.iter_users(
+                        filters={"_id": {"$in": pending}, **self.user_filter},
+                        only_with_goals=True,
+                    ):
+                        yield {
+                            "telegram_id": user["telegram_id"],
+                            "first_name": user["first_name"],
+                            "date": date,
+                        }
+
+            if JOB_QUEUE_ENABLED:
+                await JobQueue(self.db).enqueue_many(
+                    "mood_analysis",
+                    date,
+                    users_with_date(),
+                    # Not user-facing, any time before the local day ends will do
+                    not_after=end_of_local_day(now),
+                )
+            else:
+                await run_bounded(
+                    users_with_date(),
+                    self.analyze_user_mood,
+                    concurrency=MOOD_ANALYSIS_CONCURRENCY,
+                    name="MOOD_ANALYSIS",
                 )
+            print(
+                f"[MoodAnalysis] {date} active={counts['active']} pending={counts['pending']}"
+            )
             return "OK"
         except Exception as e:
             raise ValueError(e)
+
+    async def iter_active_user_pages(self, date: str):
+        """Ids of the users who talked to Rune on `date`, in pages"""
+        cursor = self.db["conversation_buckets"].aggregate(
+            [
+                {"$match": {"date": date, "message_count": {"$gt": 0}}},
+                {"$group": {"_id": "$user_id"}},
+            ],
+            allowDiskUse=True,
+            batchSize=MOOD_ANALYSIS_PAGE_SIZE,
+        )
+        page = []
+        async for doc in cursor:
+            page.append(doc["_id"])
+            if len(page) >= MOOD_ANALYSIS_PAGE_SIZE:
+                yield page
+                page = []
+        if page:
+            yield page
+
+    async def analyze_user_mood(self, user: dict):
+        """Analyze one user's mood of user["date"] and checkpoint it"""
+        tg_id = str(user["telegram_id"])
+        dt = datetime.strptime(user["date"], "%Y-%m-%d")
+        llm_service = LLMService(self.db, tg_id)
+        result = await llm_service.get_mood_sentiment(user["first_name"], dt)
+        checkpoint = JobCheckpoint(self.db, "mood_analysis", user["date"])
+        await checkpoint.mark_done(tg_id, "analyzed" if result else "no_data")
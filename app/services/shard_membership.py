@@ -0,0 +1,110 @@
+from typing import Callable, List, Optional
+from datetime import timedelta
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from app.utils.util_func import get_current_time
+import asyncio
+import socket
+import uuid
+import zlib
+import os
+
+# leader: one replica runs every cron job (see LeaderLease)
+# sharded: every process runs the jobs for its own slice of users
+SCHEDULER_MODE = os.getenv("SCHEDULER_MODE", "leader").lower()
+# Fixed sharding: set both. Otherwise the live members split the users
+SHARD_COUNT = os.getenv("SHARD_COUNT")
+SHARD_INDEX = os.getenv("SHARD_INDEX")
+SHARD_HEARTBEAT_INTERVAL = float(os.getenv("SHARD_HEARTBEAT_INTERVAL", "10"))
+# A member that missed heartbeats for this long is dropped and its slice rebalanced
+SHARD_MEMBER_TTL = int(os.getenv("SHARD_MEMBER_TTL", "30"))
+SCHEDULER_MEMBERS = "scheduler_members"
+# Every process running job queue workers, to split the Telegram rate in leader mode
+TELEGRAM_SENDER_MEMBERS = "telegram_sender_members"
+
+
+def shard_hash(telegram_id: str) -> int:
+    """Stable across processes and restarts, unlike the builtin hash()"""
+    return zlib.crc32(str(telegram_id).encode())
+
+
+def shard_filter(index: int, count: int) -> dict:
+    """Mongo filter on users for slice `index` of `count`"""
+    return {"shard_hash": {"$mod": [count, index]}}
+
+
+class ShardMembership:
+    """Which slice of the users this process owns: shard_hash % count == index.
+
+    Each member upserts a heartbeat document; the live members sorted by id
+    decide the slices, so members joining or leaving rebalance the users on
+    the next heartbeat.
+    """
+
+    def __init__(
+        self,
+        db: AsyncIOMotorDatabase,
+        collection: str = SCHEDULER_MEMBERS,
+        on_count: Optional[Callable[[int], None]] = None,
+    ):
+        self.collection = db[collection]
+        # Called with the number of live members whenever it changes
+        self.on_count = on_count
+        self.member_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.count: Optional[int] = None
+        self.index: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        if SHARD_COUNT is not None and SHARD_INDEX is not None:
+            self.count, self.index = int(SHARD_COUNT), int(SHARD_INDEX)
+
+    @property
+    def is_static(self) -> bool:
+        return SHARD_COUNT is not None and SHARD_INDEX is not None
+
+    def user_filter(self) -> Optional[dict]:
+        """Mongo filter on users for this member's slice, None before the first heartbeat"""
+        if self.count is None or self.index is None:
+            return None
+        return shard_filter(self.index, self.count)
+
+    async def heartbeat(self):
+        now = get_current_time("Asia/Jakarta")
+        await self.collection.update_one(
+            {"_id": self.member_id}, {"$set": {"heartbeat_at": now}}, upsert=True
+        )
+        alive = now - timedelta(seconds=SHARD_MEMBER_TTL)
+        members: List[str] = [
+            doc["_id"]
+            async for doc in self.collection.find(
+                {"heartbeat_at": {"$gte": alive}}, {"_id": 1}
+            ).sort("_id", 1)
+        ]
+        count, index = len(members), members.index(self.member_id)
+        if (count, index) != (self.count, self.index):
+            print(f"[Shard] {self.member_id} owns shard {index} of {count}")
+        if count != self.count and self.on_count is not None:
+            self.on_count(count)
+        self.count, self.index = count, index
+
+    async def run(self):
+        while True:
+            try:
+                await self.heartbeat()
+            except Exception as e:
+                print("SHARD_HEARTBEAT_ERR", e)
+            await asyncio.sleep(SHARD_HEARTBEAT_INTERVAL)
+
+    async def start(self):
+        if self.is_static:
+            print(f"[Shard] Static shard {self.index} of {self.count}")
+            if self.on_count is not None:
+                self.on_count(self.count)
+            return
+        await self.heartbeat()
+        self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+            # Leave right away so the others take over the slice
+            await self.collection.delete_one({"_id": self.member_id})
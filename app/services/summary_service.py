@@ -0,0 +1,84 @@
+from typing import Optional, Set
+from datetime import datetime
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from langchain_openai import ChatOpenAI
+from langchain.schema import SystemMessage, HumanMessage
+from app.services.mongo_memory import ChatMemory
+import asyncio
+import textwrap
+import os
+
+# Fold aged-out messages only once enough of them piled up
+SUMMARY_MIN_BATCH = int(os.getenv("SUMMARY_MIN_BATCH", "6"))
+SUMMARY_MAX_BATCH = int(os.getenv("SUMMARY_MAX_BATCH", "60"))
+
+# Users with a summarization in flight, and strong refs to the background tasks
+_in_progress: Set[str] = set()
+_background_tasks: Set[asyncio.Task] = set()
+
+
+class ConversationSummaryService:
+    def __init__(self, db: AsyncIOMotorDatabase, user_id: str, llm: ChatOpenAI):
+        self.user_id = user_id
+        self.llm = llm
+        self.memory = ChatMemory(db, user_id)
+
+    async def refresh_summary(self, window_start: Optional[datetime]) -> str:
+        """Fold the messages older than `window_start` that are not summarized yet"""
+        summary, summarized_until = await self.memory.get_summary_state()
+        if window_start is None:
+            return summary
+
+        aged_out = await self.memory.load_messages_between(
+            summarized_until, window_start, SUMMARY_MAX_BATCH
+        )
+        if len(aged_out) < SUMMARY_MIN_BATCH:
+            return summary
+
+        transcript = "\n".join(
+            f"{'User' if m['type'] == 'human' else 'Rune'}: {m['content']}"
+            for m in aged_out
+        )
+        system_prompt = textwrap.dedent(
+            """
+            You maintain a running summary of the conversation between a user and Rune, an AI companion for personal goals.
+            Update the existing summary with the new messages. Keep facts that matter later: the user's goals and agreed daily tasks,
+            progress, recurring feelings, preferences and anything the user asked Rune to remember.
+            Drop small talk. Write in third person, at most 250 words, and respond with the updated summary only.
+            """
+        )
+        response = await self.llm.ainvoke(
+            [
+                SystemMessage(content=system_prompt),
+                HumanMessage(
+                    content=f"Existing summary:\n{summary or '-'}\n\nNew messages:\n{transcript}"
+                ),
+            ]
+        )
+
+        new_summary = response.content.strip()
+        updated = await self.memory.update_summary(
+            new_summary,
+            summarized_until=aged_out[-1]["timestamp"],
+            expected_until=summarized_until,
+        )
+        return new_summary if updated else summary
+
+    def schedule_refresh(self, window_start: Optional[datetime]) -> None:
+        """Run refresh_summary in the background, at most once per user at a time"""
+        if window_start is None or self.user_id in _in_progress:
+            return
+
+        _in_progress.add(self.user_id)
+
+        async def run():
+            try:
+                await self.refresh_summary(window_start)
+            except Exception as e:
+                print("SUMMARY_REFRESH_ERR", e)
+            finally:
+                _in_progress.discard(self.user_id)
+
+        task = asyncio.create_task(run())
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
@@ -1,11 +1,63 @@
-from typing import Optional, List
+from typing import AsyncIterator, Optional, List
 from datetime import datetime
+import os
 
 from fastapi import HTTPException
 from app.schemas.user_schema import UserCreate, UserOut, UserBasicInfo
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from telegram import User
 from pymongo import ReturnDocument
+from app.services.shard_membership import shard_hash
+from app.services.daily_share_drafts import DAILY_SHARE_DRAFTS
+from app.utils.cache import TTLCache
+from app.utils.util_func import DEFAULT_TIMEZONE, is_valid_timezone
+
+USER_ITER_BATCH_SIZE = int(os.getenv("USER_ITER_BATCH_SIZE", "500"))
+# Fields the scheduler jobs need from a user document
+USER_JOB_FIELDS = ["telegram_id", "first_name", "language", "timezone"]
+# Every local date (today's progress, conversation buckets) needs the user's timezone
+USER_TIMEZONE_CACHE_SIZE = int(os.getenv("USER_TIMEZONE_CACHE_SIZE", "10000"))
+USER_TIMEZONE_CACHE_TTL = int(os.getenv("USER_TIMEZONE_CACHE_TTL", "300"))
+
+_timezone_cache = TTLCache(USER_TIMEZONE_CACHE_SIZE, USER_TIMEZONE_CACHE_TTL)
+# Distinct timezones of all users, read on every scheduler tick
+_timezones_cache = TTLCache(1, USER_TIMEZONE_CACHE_TTL)
+
+
+async def get_user_timezone(db: AsyncIOMotorDatabase, telegram_id: str) -> str:
+    """Read-through cached timezone name of a user, DEFAULT_TIMEZONE if unset"""
+    tz = _timezone_cache.get(telegram_id)
+    if tz is None:
+        doc = await db["users"].find_one({"_id": telegram_id}, {"timezone": 1})
+        tz = (doc or {}).get("timezone") or DEFAULT_TIMEZONE
+        _timezone_cache.set(telegram_id, tz)
+    return tz
+
+
+def timezone_filter(timezones: List[str]) -> dict:
+    """Mongo filter on users living in one of `timezones`"""
+    names = list(timezones)
+    if DEFAULT_TIMEZONE in names:
+        # Users without a timezone follow the default one
+        names.append(None)
+    return {"timezone": {"$in": names}}
+
+
+def progress_task_ids(status: str) -> dict:
+    """Aggregation expression: ids of today's progress tasks flagged `status`"""
+    return {
+        "$map": {
+            "input": {
+                "$filter": {
+                    "input": "$progress_tasks",
+                    "as": "p",
+                    "cond": {"$eq": [f"$$p.{status}", True]},
+                }
+            },
+            "as": "p",
+            "in": "$$p.task_id",
+        }
+    }
 
 
 class UserService:
@@ -50,6 +102,8 @@ class UserService:
 
     async def create_user(self, user_data: dict):
         try:
+            # Stable shard of the user for sharded scheduling
+            user_data.setdefault("shard_hash", shard_hash(user_data["_id"]))
             await self.collection.insert_one(user_data)
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"create_user error: {str(e)}")
@@ -66,16 +120,205 @@ class UserService:
         )
         return result.modified_count > 0
 
-    async def find_all(self):
-        try:
-            cursor = self.collection.find({})
-            user_list = []
-            async for doc in cursor:
-                user_list.append(UserBasicInfo(**doc).model_dump())
-            return user_list
-        except Exception as e:
-            print("ERROR ", e)
-            raise ValueError(e)
+    async def iter_users(
+        self,
+        fields: Optional[List[str]] = None,
+        filters: Optional[dict] = None,
+        only_with_goals: bool = False,
+        batch_size: int = USER_ITER_BATCH_SIZE,
+    ) -> AsyncIterator[dict]:
+        """Stream raw user documents, projected to `fields`, batch by batch.
+
+        With `only_with_goals`, only users that have daily tasks are yielded,
+        each with its goal's `daily_tasks` attached.
+        """
+        projection = {field: 1 for field in fields or USER_JOB_FIELDS}
+        if not only_with_goals:
+            cursor = self.collection.find(filters or {}, projection).batch_size(
+                batch_size
+            )
+        else:
+            pipeline = [
+                {"$match": filters or {}},
+                {
+                    "$lookup": {
+                        "from": "users_goals",
+                        "localField": "_id",
+                        "foreignField": "_id",
+                        "as": "goals",
+                    }
+                },
+                {"$match": {"goals.daily_tasks.0": {"$exists": True}}},
+                {
+                    "$project": {
+                        **projection,
+                        "daily_tasks": {"$arrayElemAt": ["$goals.daily_tasks", 0]},
+                    }
+                },
+            ]
+            cursor = self.collection.aggregate(pipeline, batchSize=batch_size)
+
+        async for doc in cursor:
+            yield doc
+
+    async def iter_users_without_draft(
+        self,
+        date: str,
+        filters: Optional[dict] = None,
+        batch_size: int = USER_ITER_BATCH_SIZE,
+    ) -> AsyncIterator[dict]:
+        """Stream the users that have no daily share draft for `date` yet.
+
+        Drafted users are left out by the query, joined on the draft key
+        "<user_id>:<date>", instead of being loaded and filtered here.
+        """
+        pipeline = [
+            {"$match": filters or {}},
+            {
+                "$addFields": {
+                    "draft_id": {"$concat": [{"$toString": "$_id"}, f":{date}"]}
+                }
+            },
+            {
+                "$lookup": {
+                    "from": DAILY_SHARE_DRAFTS,
+                    "localField": "draft_id",
+                    "foreignField": "_id",
+                    "as": "draft",
+                }
+            },
+            {"$match": {"draft.0": {"$exists": False}}},
+            {"$project": {field: 1 for field in USER_JOB_FIELDS}},
+        ]
+        async for doc in self.collection.aggregate(pipeline, batchSize=batch_size):
+            yield doc
+
+    async def iter_reminder_roster(
+        self,
+        date: str,
+        filters: Optional[dict] = None,
+        batch_size: int = USER_ITER_BATCH_SIZE,
+    ) -> AsyncIterator[dict]:
+        """Stream ready-to-send reminder payloads for `date` with one aggregation.
+
+        Each payload is {telegram_id, first_name, tasks}, where tasks have the
+        shape of convert_tasks_list_reminder. Users without daily tasks or with
+        every task already completed or skipped are left out.
+        """
+        pipeline = [
+            {"$match": filters or {}},
+            {
+                "$lookup": {
+                    "from": "users_goals",
+                    "localField": "_id",
+                    "foreignField": "_id",
+                    "as": "goals",
+                }
+            },
+            {"$match": {"goals.daily_tasks.0": {"$exists": True}}},
+            {
+                "$lookup": {
+                    "from": "daily_progress",
+                    "let": {"uid": "$_id"},
+                    "pipeline": [
+                        {
+                            "$match": {
+                                "$expr": {
+                                    "$and": [
+                                        {"$eq": ["$telegram_id", "$$uid"]},
+                                        {"$eq": ["$date", date]},
+                                    ]
+                                }
+                            }
+                        },
+                        {"$project": {"tasks": 1}},
+                    ],
+                    "as": "progress",
+                }
+            },
+            {
+                "$project": {
+                    "telegram_id": 1,
+                    "first_name": 1,
+                    "daily_tasks": {"$arrayElemAt": ["$goals.daily_tasks", 0]},
+                    "progress_tasks": {
+                        "$ifNull": [{"$arrayElemAt": ["$progress.tasks", 0]}, []]
+                    },
+                }
+            },
+            {
+                "$addFields": {
+                    "progress_ids": {
+                        "$map": {
+                            "input": "$progress_tasks",
+                            "as": "p",
+                            "in": "$$p.task_id",
+                        }
+                    },
+                    "completed_ids": progress_task_ids("completed"),
+                    "skipped_ids": progress_task_ids("skipped"),
+                }
+            },
+            {
+                "$project": {
+                    "telegram_id": 1,
+                    "first_name": 1,
+                    "tasks": {
+                        "$map": {
+                            # Once today's progress exists, only its tasks count
+                            "input": {
+                                "$filter": {
+                                    "input": "$daily_tasks",
+                                    "as": "t",
+                                    "cond": {
+                                        "$or": [
+                                            {"$eq": [{"$size": "$progress_ids"}, 0]},
+                                            {"$in": ["$$t.id", "$progress_ids"]},
+                                        ]
+                                    },
+                                }
+                            },
+                            "as": "t",
+                            "in": {
+                                "task_id": "$$t.id",
+                                "title": "$$t.title",
+                                "note": "$$t.note",
+                                "min_required_completion": "$$t.min_required_completion",
+                                "completion_unit": "$$t.completion_unit",
+                                "completed": {"$in": ["$$t.id", "$completed_ids"]},
+                                "skipped": {"$in": ["$$t.id", "$skipped_ids"]},
+                            },
+                        }
+                    },
+                }
+            },
+            {
+                "$match": {
+                    "tasks": {"$elemMatch": {"completed": False, "skipped": False}}
+                }
+            },
+        ]
+        cursor = self.collection.aggregate(pipeline, batchSize=batch_size)
+        async for doc in cursor:
+            yield doc
+
+    async def set_timezone(self, telegram_id: str, timezone: str):
+        if not is_valid_timezone(timezone):
+            raise ValueError(f"Unknown timezone {timezone}")
+        await self.collection.update_one(
+            {"_id": telegram_id}, {"$set": {"timezone": timezone}}
+        )
+        _timezone_cache.set(telegram_id, timezone)
+        _timezones_cache.clear()
+
+    async def list_timezones(self) -> List[str]:
+        """Timezones that have at least one user, the default one always included"""
+        timezones = _timezones_cache.get("all")
+        if timezones is None:
+            names = await self.collection.distinct("timezone")
+            timezones = sorted({name for name in names if name} | {DEFAULT_TIMEZONE})
+            _timezones_cache.set("all", timezones)
+        return timezones
 
     def calculate_level(self, exp: int) -> int:
         return int((exp // 100) + 1)
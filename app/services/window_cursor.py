@@ -0,0 +1,46 @@
+from typing import Optional
+from datetime import datetime, timedelta
+from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+import pytz
+import os
+
+SCHEDULER_WINDOWS = "scheduler_windows"
+# Cursors of slices no longer in use (the member count changed) are removed after this long
+WINDOW_CURSOR_TTL = int(os.getenv("WINDOW_CURSOR_TTL", str(7 * 24 * 3600)))
+
+
+class WindowCursor:
+    """Last minute a delivery window job has processed: {_id: key, last_minute}.
+
+    A tick claims every minute after the stored one up to its own, so ticks
+    dropped by the scheduler (late start, too many running) are caught up by
+    the next one, and two overlapping ticks never process the same minute.
+    """
+
+    def __init__(self, db: AsyncIOMotorDatabase, key: str):
+        self.collection = db[SCHEDULER_WINDOWS]
+        self.key = key
+
+    async def advance(self, now: datetime) -> Optional[datetime]:
+        """Move the cursor to `now` and return where it was, None if already there"""
+        doc = await self.collection.find_one_and_update(
+            {"_id": self.key, "last_minute": {"$lt": now}},
+            {"$set": {"last_minute": now, "updated_at": now}},
+            return_document=ReturnDocument.BEFORE,
+        )
+        if doc:
+            last = doc["last_minute"]
+            # Mongo returns naive UTC
+            return pytz.utc.localize(last) if last.tzinfo is None else last
+
+        try:
+            await self.collection.insert_one(
+                {"_id": self.key, "last_minute": now, "updated_at": now}
+            )
+        except DuplicateKeyError:
+            # Another tick already processed this minute
+            return None
+        # First run: nothing to catch up
+        return now - timedelta(minutes=1)
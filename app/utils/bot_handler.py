@@ -1,7 +1,8 @@
 from http import HTTPStatus
 import os
 from fastapi import APIRouter, Request, Depends, HTTPException, Response
-from telegram import Update, Bot
+from telegram import Update, Bot, Message
+from telegram.error import BadRequest, RetryAfter
 from telegram.ext import (
     Application,
     CommandHandler,
@@ -15,13 +16,26 @@ from telegram.ext._utils.types import BD
 from app.db.mongo import get_database
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from dotenv import load_dotenv
-from app.services.user_service import UserService
+from app.services.user_service import UserService, get_user_timezone
 from app.db.mongo import get_database
 from app.services.llm_service import LLMService
 from app.services.mongo_memory import ChatMemory
 from app.services.goals_service import UserGoalService
+from app.utils.task_reminder import (
+    LIST_CALLBACK_SUFFIX,
+    TASK_REF_PREFIX,
+    render_task_reminder,
+    resolve_task_id,
+)
+from app.utils.util_func import (
+    get_current_time,
+    normalize_timezone,
+    retry_after_seconds,
+)
 import asyncio
 import textwrap
+from contextlib import aclosing
+from typing import AsyncIterator
 
 load_dotenv()
 
@@ -29,6 +43,11 @@ router = APIRouter()
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 ENABLE_WEBHOOK = os.getenv("ENABLE_WEBHOOK", "false").lower() == "true"
 WEBHOOK_URL = os.getenv("WEBHOOK_URL", "")
+# Stream LLM replies by sending early and editing the message as tokens arrive
+STREAM_REPLIES = os.getenv("STREAM_REPLIES", "true").lower() == "true"
+STREAM_FIRST_CHUNK_CHARS = int(os.getenv("STREAM_FIRST_CHUNK_CHARS", "20"))
+STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", "1.0"))
+TELEGRAM_MESSAGE_LIMIT = 4096
 
 # Initialize bot and app
 app = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
@@ -58,41 +77,127 @@ async def handle_message(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     db = await get_database()
     llm_service = LLMService(db, user.id)
+    if STREAM_REPLIES:
+        chunks = llm_service.stream_user_message(user, user_input)
+        await send_streamed_reply(update.message, chunks)
+        return
     response = await llm_service.reply_user_message(user, user_input)
     await update.message.reply_text(response, parse_mode="Markdown")
 
 
+async def send_streamed_reply(message: Message, chunks: AsyncIterator[str]):
+    """Send the first chunks early, then edit the message as more text arrives.
+
+    Intermediate edits are plain text (partial Markdown may not parse) and are
+    throttled to STREAM_EDIT_INTERVAL to stay within Telegram's edit limits;
+    the final edit applies Markdown.
+    """
+    loop = asyncio.get_running_loop()
+    text = ""
+    sent_text = ""
+    reply = None
+    next_edit_at = 0.0
+
+    # Closed right away if a send fails, so the stream saves the partial turn
+    async with aclosing(chunks):
+        async for chunk in chunks:
+            text += chunk
+            visible = text[:TELEGRAM_MESSAGE_LIMIT]
+            if reply is None:
+                if len(text.strip()) >= STREAM_FIRST_CHUNK_CHARS:
+                    reply = await message.reply_text(visible)
+                    sent_text = visible
+                    next_edit_at = loop.time() + STREAM_EDIT_INTERVAL
+                continue
+            if loop.time() < next_edit_at or visible == sent_text:
+                continue
+            try:
+                await reply.edit_text(visible)
+                sent_text = visible
+                next_edit_at = loop.time() + STREAM_EDIT_INTERVAL
+            except RetryAfter as e:
+                next_edit_at = loop.time() + retry_after_seconds(e.retry_after)
+            except BadRequest as e:
+                print("STREAM_EDIT_ERR", e)
+                next_edit_at = loop.time() + STREAM_EDIT_INTERVAL
+
+    parts = [
+        text[i : i + TELEGRAM_MESSAGE_LIMIT]
+        for i in range(0, len(text), TELEGRAM_MESSAGE_LIMIT)
+    ] or ["..."]
+    if reply is None:
+        await reply_markdown(message, parts[0])
+    else:
+        await edit_markdown(reply, parts[0])
+    for part in parts[1:]:
+        await reply_markdown(message, part)
+
+
+async def reply_markdown(message: Message, text: str):
+    try:
+        return await message.reply_text(text, parse_mode="Markdown")
+    except BadRequest:
+        return await message.reply_text(text)
+
+
+async def edit_markdown(message: Message, text: str):
+    try:
+        await message.edit_text(text, parse_mode="Markdown")
+    except BadRequest as e:
+        # Invalid Markdown: keep the plain text, unless it is already up to date
+        if "not modified" not in str(e).lower():
+            await message.edit_text(text)
+
+
 async def handle_task_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
-    await query.answer()  # Acknowledge the button click
     user = update.effective_user
-    data = query.data  # e.g. "complete:task123"
-    action, task_id = data.split(":")
+    data = query.data  # e.g. "complete:task123" or "complete:task123:list"
+    action, task_id, *rest = data.split(":")
+    in_list = rest == [LIST_CALLBACK_SUFFIX]
     db = await get_database()
     goal_service = UserGoalService(db, str(update.effective_user.id))
     user_service = UserService(db)
 
+    if task_id.startswith(TASK_REF_PREFIX):
+        # Long ids are hashed to fit Telegram's callback data limit
+        daily_tasks = await goal_service.load_daily_tasks_list() or []
+        task_id = resolve_task_id(task_id, [task["id"] for task in daily_tasks])
+        if task_id is None:
+            await query.answer("⚠️ This task no longer exists.")
+            return
+
     if action == "complete":
         exp_incr = 75
         _, task = await asyncio.gather(
             user_service.increase_exp(str(user.id), exp_incr),
             goal_service.update_daily_task(task_id, is_complete=True),
         )
-        await query.edit_message_text(
-            f"✅ *{task.title}* marked as completed!\n\n_📈 +{exp_incr} EXP_",
-            parse_mode="Markdown",
-        )
+        text = f"✅ *{task.title}* marked as completed!\n\n_📈 +{exp_incr} EXP_"
+        notice = f"✅ {task.title} completed! +{exp_incr} EXP"
     elif action == "skip":
         exp_decr = 125
         _, task = await asyncio.gather(
             user_service.decrease_exp(str(user.id), exp_decr),
             goal_service.update_daily_task(task_id, is_complete=False),
         )
-        await query.edit_message_text(
-            f"⏭️ *{task.title}* skipped\n\n_📉 -{exp_decr} EXP_", parse_mode="Markdown"
-        )
+        text = f"⏭️ *{task.title}* skipped\n\n_📉 -{exp_decr} EXP_"
+        notice = f"⏭️ {task.title} skipped. -{exp_decr} EXP"
     else:
+        await query.answer()
         await query.edit_message_text("⚠️ Unknown action.")
+        return
+
+    if not in_list:
+        await query.answer()  # Acknowledge the button click
+        await query.edit_message_text(text, parse_mode="Markdown")
+        return
+
+    # Consolidated reminder: show the result as a toast and re-render the list
+    await query.answer(notice)
+    tasks = await goal_service.convert_tasks_list_reminder()
+    text, keyboard = render_task_reminder(user.first_name, tasks)
+    await query.edit_message_text(text, reply_markup=keyboard, parse_mode="Markdown")
 
 
 async def handle_mood_sentiment(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -142,11 +247,45 @@ async def handle_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
         raise ValueError(e)
 
 
+async def handle_timezone(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """/timezone shows the user's timezone, /timezone <Area/City> changes it"""
+    try:
+        db = await get_database()
+        telegram_id = str(update.effective_user.id)
+        if not context.args:
+            timezone = await get_user_timezone(db, telegram_id)
+            return await update.message.reply_text(
+                f"🕰 Your timezone is `{timezone}`, local time "
+                f"{get_current_time(timezone).strftime('%H:%M')}.\n"
+                "Change it with e.g. `/timezone Europe/Berlin`",
+                parse_mode="Markdown",
+            )
+
+        timezone = normalize_timezone(context.args[0])
+        if not timezone:
+            return await update.message.reply_text(
+                "I don't know that timezone. Please use a name like "
+                "`Asia/Jakarta` or `America/New_York`",
+                parse_mode="Markdown",
+            )
+        await UserService(db).set_timezone(telegram_id, timezone)
+        return await update.message.reply_text(
+            f"✅ Timezone set to `{timezone}`, local time "
+            f"{get_current_time(timezone).strftime('%H:%M')}.\n"
+            "Reminders and your daily progress follow it from now on.",
+            parse_mode="Markdown",
+        )
+    except Exception as e:
+        print("TELEGRAM_CMD_TIMEZONE ERR", e)
+        raise ValueError(e)
+
+
 app.add_handler(CommandHandler("start", start_command))
 app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND, handle_message))
 app.add_handler(CallbackQueryHandler(handle_task_callback))
 app.add_handler(CommandHandler("mood", handle_mood_sentiment))
 app.add_handler(CommandHandler("profile", handle_stats))
+app.add_handler(CommandHandler("timezone", handle_timezone))
 
 
 # Webhook endpoint
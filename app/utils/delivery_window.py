@@ -0,0 +1,185 @@
+from typing import Callable, Dict, List, Optional, Tuple
+from datetime import datetime, timedelta
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from apscheduler.triggers.cron import CronTrigger
+from app.utils.util_func import end_of_local_day, get_tzinfo
+import pytz
+import os
+
+# Spread per-user work over a window instead of firing everyone at once
+DELIVERY_WINDOWS_ENABLED = (
+    os.getenv("DELIVERY_WINDOWS_ENABLED", "true").lower() == "true"
+)
+DELIVERY_SLOT_MINUTES = int(os.getenv("DELIVERY_SLOT_MINUTES", "1"))
+REMIND_WINDOW_MINUTES = int(os.getenv("REMIND_WINDOW_MINUTES", "30"))
+# Starts after the 20:00 reminder window so the two never overlap
+DAILY_SHARE_START = os.getenv("DAILY_SHARE_START", "20:30")
+DAILY_SHARE_WINDOW_MINUTES = int(os.getenv("DAILY_SHARE_WINDOW_MINUTES", "60"))
+# Daily share messages are generated off-peak, the send window only reads them
+DAILY_SHARE_PREGEN_ENABLED = (
+    os.getenv("DAILY_SHARE_PREGEN_ENABLED", "true").lower() == "true"
+)
+DAILY_SHARE_PREGEN_START = os.getenv("DAILY_SHARE_PREGEN_START", "17:00")
+DAILY_SHARE_PREGEN_WINDOW_MINUTES = int(
+    os.getenv("DAILY_SHARE_PREGEN_WINDOW_MINUTES", "120")
+)
+MOOD_ANALYSIS_WINDOW_MINUTES = int(os.getenv("MOOD_ANALYSIS_WINDOW_MINUTES", "60"))
+# Queued work of a slot still runs this long after the window ends, then expires
+DELIVERY_LATE_MINUTES = int(os.getenv("DELIVERY_LATE_MINUTES", "60"))
+# Slots missed by dropped ticks are caught up for at most this long
+DELIVERY_CATCHUP_MINUTES = int(os.getenv("DELIVERY_CATCHUP_MINUTES", "180"))
+# Slots use the high bits of shard_hash, shards the low ones (shard_hash % count)
+SLOT_HASH_DIVISOR = 65536
+# Every UTC offset in use is a multiple of 15 minutes
+TIMEZONE_OFFSET_MINUTES = 15
+MINUTES_PER_DAY = 24 * 60
+
+
+class DeliveryWindow:
+    """A daily window in the users' local time, split into slots.
+
+    The slot of a user is derived from its shard_hash, so the user is served
+    at the same local minute every day while the users of a timezone are
+    spread evenly over the window. Timezones reach the window at different
+    UTC times, which spreads the load over the day as well.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        hour: int,
+        minute: int,
+        length_minutes: int,
+        slot_minutes: int = DELIVERY_SLOT_MINUTES,
+    ):
+        if not DELIVERY_WINDOWS_ENABLED:
+            length_minutes = slot_minutes
+        self.name = name
+        self.start = hour * 60 + minute
+        self.length = max(length_minutes, slot_minutes)
+        self.slot_minutes = slot_minutes
+        self.slots = self.length // slot_minutes
+
+    @property
+    def end(self) -> int:
+        return self.start + self.length
+
+    def overlaps(self, other: "DeliveryWindow") -> bool:
+        return self.start < other.end and other.start < self.end
+
+    def slot_filter(self, slot: int) -> Optional[dict]:
+        """Mongo filter on users for one slot, None when there is a single slot"""
+        if self.slots <= 1:
+            return None
+        return {
+            "$expr": {
+                "$eq": [
+                    {
+                        "$mod": [
+                            {
+                                "$floor": {
+                                    "$divide": [
+                                        {"$ifNull": ["$shard_hash", 0]},
+                                        SLOT_HASH_DIVISOR,
+                                    ]
+                                }
+                            },
+                            self.slots,
+                        ]
+                    },
+                    slot,
+                ]
+            }
+        }
+
+    def deadline(self, slot: int, local_now: datetime) -> datetime:
+        """Latest time the work of `slot` started at `local_now` may still run"""
+        remaining = self.length - slot * self.slot_minutes + DELIVERY_LATE_MINUTES
+        return min(
+            local_now + timedelta(minutes=remaining), end_of_local_day(local_now)
+        )
+
+    def trigger_minutes(self) -> str:
+        """Cron minutes (UTC) at which a slot starts in some timezone"""
+        residues = {
+            (self.start + slot * self.slot_minutes) % TIMEZONE_OFFSET_MINUTES
+            for slot in range(self.slots)
+        }
+        if len(residues) == TIMEZONE_OFFSET_MINUTES:
+            return "*"
+        return ",".join(
+            str(minute)
+            for minute in range(60)
+            if minute % TIMEZONE_OFFSET_MINUTES in residues
+        )
+
+    def due(
+        self, now: datetime, timezones: List[str]
+    ) -> List[Tuple[int, List[str], datetime]]:
+        """Slots starting at `now`, as (slot, timezones, local time) groups"""
+        groups: Dict[Tuple[int, str], List[str]] = {}
+        local_times: Dict[Tuple[int, str], datetime] = {}
+        for name in timezones:
+            local = now.astimezone(get_tzinfo(name))
+            offset = (local.hour * 60 + local.minute - self.start) % MINUTES_PER_DAY
+            if offset >= self.length or offset % self.slot_minutes:
+                continue
+            key = (offset // self.slot_minutes, local.strftime("%Y-%m-%d"))
+            groups.setdefault(key, []).append(name)
+            local_times.setdefault(key, local)
+        return [
+            (slot, names, local_times[(slot, date)])
+            for (slot, date), names in groups.items()
+        ]
+
+    def schedule(self, scheduler: AsyncIOScheduler, job: Callable):
+        """Register `job(window)` on every minute a slot may start.
+
+        The job must process every slot since its previous run (run_window).
+        """
+        scheduler.add_job(
+            job,
+            CronTrigger(minute=self.trigger_minutes(), timezone=pytz.utc),
+            args=[self],
+            id=self.name,
+            # Late or dropped ticks are caught up from the window cursor, so
+            # run however late and merge missed runs into one
+            misfire_grace_time=None,
+            coalesce=True,
+            # The next tick serves other users, it must not wait for this one
+            max_instances=10,
+        )
+
+
+def warn_on_overlap(windows: List[DeliveryWindow]):
+    for i, a in enumerate(windows):
+        for b in windows[i + 1 :]:
+            if a.overlaps(b):
+                print(f"[DeliveryWindow] {a.name} overlaps {b.name}")
+
+
+def parse_hour_minute(value: str):
+    hour, minute = value.split(":")
+    return int(hour), int(minute)
+
+
+# Windows are in each user's local time
+REMIND_WINDOWS = [
+    DeliveryWindow(f"remind_{hour:02d}", hour, 0, REMIND_WINDOW_MINUTES)
+    for hour in (6, 12, 20)
+]
+DAILY_SHARE_WINDOW = DeliveryWindow(
+    "daily_share", *parse_hour_minute(DAILY_SHARE_START), DAILY_SHARE_WINDOW_MINUTES
+)
+DAILY_SHARE_PREGEN_WINDOW = DeliveryWindow(
+    "daily_share_pregen",
+    *parse_hour_minute(DAILY_SHARE_PREGEN_START),
+    DAILY_SHARE_PREGEN_WINDOW_MINUTES,
+)
+MOOD_ANALYSIS_WINDOW = DeliveryWindow(
+    "mood_analysis", 1, 30, MOOD_ANALYSIS_WINDOW_MINUTES
+)
+# Bulk creation at local midnight, a single slot
+DAILY_PROGRESS_WINDOW = DeliveryWindow(
+    "daily_progress", 0, 0, DELIVERY_SLOT_MINUTES, DELIVERY_SLOT_MINUTES
+)
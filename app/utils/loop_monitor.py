@@ -0,0 +1,39 @@
+import asyncio
+import time
+import os
+
+# Report when the event loop was blocked for longer than this (seconds)
+LOOP_LAG_THRESHOLD = float(os.getenv("LOOP_LAG_THRESHOLD", "0.25"))
+LOOP_LAG_INTERVAL = float(os.getenv("LOOP_LAG_INTERVAL", "0.5"))
+# asyncio debug mode logs the exact callback that was slow, costly in production
+LOOP_DEBUG = os.getenv("LOOP_DEBUG", "false").lower() == "true"
+
+_monitor_task: asyncio.Task | None = None
+
+
+async def _watch_event_loop():
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(LOOP_LAG_INTERVAL)
+        lag = loop.time() - started - LOOP_LAG_INTERVAL
+        if lag > LOOP_LAG_THRESHOLD:
+            print(f"EVENT_LOOP_BLOCKED lag={lag:.3f}s at {time.strftime('%H:%M:%S')}")
+
+
+def start_loop_monitor():
+    """Start a heartbeat task that reports event loop stalls (blocking calls)"""
+    global _monitor_task
+    loop = asyncio.get_running_loop()
+    if LOOP_DEBUG:
+        loop.set_debug(True)
+        loop.slow_callback_duration = LOOP_LAG_THRESHOLD
+    if _monitor_task is None or _monitor_task.done():
+        _monitor_task = loop.create_task(_watch_event_loop())
+
+
+def stop_loop_monitor():
+    global _monitor_task
+    if _monitor_task is not None:
+        _monitor_task.cancel()
+        _monitor_task = None
@@ -1,52 +1,253 @@
 from app.utils.util_func import get_current_time
+from app.utils.delivery_window import DELIVERY_CATCHUP_MINUTES, DeliveryWindow
 from app.db.mongo import get_database
 from app.services.goals_service import UserGoalService
-from app.services.user_service import UserService
+from app.services.user_service import UserService, timezone_filter
 from app.services.scheduler_service import SchedulerService
+from app.services.intent_classifier import train_local_classifier
+from app.services.classification_cache import classification_cache_stats
+from app.services.job_queue import JOB_QUEUE_ENABLED, JobWorkerPool
+from app.services.leader_lease import LeaderLease
+from app.services.shard_membership import (
+    SCHEDULER_MODE,
+    TELEGRAM_SENDER_MEMBERS,
+    ShardMembership,
+    shard_filter,
+)
+from app.utils.telegram_dispatcher import TELEGRAM_SENDER_PROCESSES, dispatcher
+from app.services.window_cursor import WindowCursor
+from datetime import datetime, timedelta
+from functools import wraps
+from typing import Awaitable, Callable, Optional, Tuple
+import pytz
+
+job_workers: JobWorkerPool | None = None
+leader_lease: LeaderLease | None = None
+shard_membership: ShardMembership | None = None
+# Counts the job queue workers of every replica in leader mode
+sender_membership: ShardMembership | None = None
+
+
+def leader_only(job):
+    """Run a cron job only on the replica holding the scheduler lease.
+
+    In sharded mode every process runs it for its own slice of users.
+    """
+
+    @wraps(job)
+    async def wrapper(*args, **kwargs):
+        if SCHEDULER_MODE == "sharded":
+            if shard_membership is None or shard_membership.user_filter() is None:
+                print(f"[Scheduler] No shard assigned yet, skipping {job.__name__}")
+                return None
+            return await job(*args, **kwargs)
+        if leader_lease is None or not leader_lease.is_leader:
+            # Window jobs tick every few minutes, followers skip them quietly
+            return None
+        return await job(*args, **kwargs)
+
+    return wrapper
+
+
+def current_shard() -> Optional[Tuple[int, int]]:
+    """(index, count) of this process's slice, None outside sharded mode"""
+    if SCHEDULER_MODE != "sharded" or shard_membership is None:
+        return None
+    if shard_membership.count is None or shard_membership.index is None:
+        return None
+    return shard_membership.index, shard_membership.count
+
+
+async def get_scheduler_service(
+    *user_filters: Optional[dict],
+    deadline: Optional[datetime] = None,
+    shard: Optional[Tuple[int, int]] = None,
+) -> SchedulerService:
+    """SchedulerService limited to this process's shard and the given users.
+
+    `shard` pins the slice, by default the current one.
+    """
+    db = await get_database()
+    filters = list(user_filters)
+    shard = shard or current_shard()
+    if shard is not None:
+        filters.append(shard_filter(*shard))
+    filters = [f for f in filters if f]
+    if not filters:
+        return SchedulerService(db, deadline=deadline)
+    if len(filters) == 1:
+        return SchedulerService(db, filters[0], deadline)
+    return SchedulerService(db, {"$and": filters}, deadline)
+
+
+def window_cursor_key(window: DeliveryWindow, shard: Optional[Tuple[int, int]]) -> str:
+    # In sharded mode each slice has its own cursor. It outlives the member
+    # serving it, so whoever owns the slice after a restart or a rebalance
+    # carries on from the same minute
+    if shard is not None:
+        index, count = shard
+        return f"{window.name}:{index}/{count}"
+    return window.name
+
+
+async def run_window(
+    window: DeliveryWindow,
+    run: Callable[[SchedulerService, datetime], Awaitable],
+):
+    """Run `run` once per group of timezones whose local time starts a slot.
+
+    Every minute since the last processed one is covered, so slots of
+    dropped or late ticks are caught up.
+    """
+    now = datetime.now(pytz.utc).replace(second=0, microsecond=0)
+    db = await get_database()
+    # The cursor and the user filter must describe the same slice, even if a
+    # heartbeat rebalances the members while the window runs
+    shard = current_shard()
+    last = await WindowCursor(db, window_cursor_key(window, shard)).advance(now)
+    if last is None:
+        return
+    minute = max(last, now - timedelta(minutes=DELIVERY_CATCHUP_MINUTES))
+    timezones = await UserService(db).list_timezones()
+
+    while (minute := minute + timedelta(minutes=1)) <= now:
+        for slot, names, local_now in window.due(minute, timezones):
+            deadline = window.deadline(slot, local_now)
+            if deadline <= datetime.now(pytz.utc):
+                print(
+                    f"[Scheduler] {window.name} slot={slot} {names} too late, skipped"
+                )
+                continue
+            if minute < now:
+                print(f"[Scheduler] {window.name} catching up {minute:%H:%M} UTC")
+            print(f"[Scheduler] {window.name} slot={slot} timezones={names}")
+            try:
+                scheduler_service = await get_scheduler_service(
+                    timezone_filter(names),
+                    window.slot_filter(slot),
+                    deadline=deadline,
+                    shard=shard,
+                )
+                await run(scheduler_service, local_now)
+            except Exception as e:
+                # The cursor already moved on, don't lose the other slots
+                print("RUN_WINDOW_ERR", window.name, slot, names, e)
 
 
 def test_cron_job():
     print("🔁 Running scheduled task..")
 
 
-async def remind_user_tasks():
+@leader_only
+async def remind_user_tasks(window: DeliveryWindow):
     try:
-        db = await get_database()
-        scheduler_service = SchedulerService(db)
-        await scheduler_service.remind_daily_tasks()
+        await run_window(window, lambda service, now: service.remind_daily_tasks(now))
         return "OK"
     except Exception as e:
         print("REMIND_USER_TASKS ERR ", e)
         raise ValueError(e)
 
 
-async def daily_progress_creation():
+@leader_only
+async def daily_progress_creation(window: DeliveryWindow):
     try:
-        db = await get_database()
-        scheduler_service = SchedulerService(db)
-        await scheduler_service.daily_progress_creation()
+        await run_window(
+            window, lambda service, now: service.daily_progress_creation(now)
+        )
         return "OK"
     except Exception as e:
         print("REMIND_USER_TASKS ERR ", e)
         raise ValueError(e)
 
 
-async def ask_daily_share():
+@leader_only
+async def ask_daily_share(window: DeliveryWindow):
     try:
-        db = await get_database()
-        scheduler_service = SchedulerService(db)
-        await scheduler_service.ask_daily_share()
+        await run_window(window, lambda service, now: service.ask_daily_share(now))
         return "OK"
     except Exception as e:
         print("REMIND_USER_TASKS ERR ", e)
         raise ValueError(e)
 
 
-async def analyze_daily_sentiment():
+@leader_only
+async def pregenerate_daily_share(window: DeliveryWindow):
+    try:
+        await run_window(
+            window, lambda service, now: service.pregenerate_daily_share(now)
+        )
+        return "OK"
+    except Exception as e:
+        print("PREGENERATE_DAILY_SHARE ERR ", e)
+        raise ValueError(e)
+
+
+@leader_only
+async def analyze_daily_sentiment(window: DeliveryWindow):
+    try:
+        await run_window(
+            window, lambda service, now: service.analyze_daily_sentiment(now)
+        )
+        return "OK"
+    except Exception as e:
+        raise ValueError(e)
+
+
+async def retrain_intent_classifier():
+    # Hourly per process, like the cache itself; counters are since startup
+    print("[ClassificationCache]", classification_cache_stats())
     try:
         db = await get_database()
-        scheduler_service = SchedulerService(db)
-        await scheduler_service.analyze_daily_sentiment()
+        await train_local_classifier(db)
         return "OK"
     except Exception as e:
+        print("RETRAIN_INTENT_CLASSIFIER ERR ", e)
         raise ValueError(e)
+
+
+async def start_job_workers():
+    global job_workers, sender_membership
+    if not JOB_QUEUE_ENABLED:
+        return
+    db = await get_database()
+    # Workers send on every replica; in sharded mode the shard members already
+    # split the Telegram rate, in leader mode count the replicas separately
+    if SCHEDULER_MODE != "sharded" and TELEGRAM_SENDER_PROCESSES is None:
+        sender_membership = ShardMembership(
+            db, TELEGRAM_SENDER_MEMBERS, on_count=dispatcher.set_sender_processes
+        )
+        await sender_membership.start()
+    job_workers = JobWorkerPool(db, SchedulerService(db).job_handlers())
+    job_workers.start()
+
+
+async def stop_job_workers():
+    global job_workers, sender_membership
+    if job_workers is not None:
+        await job_workers.stop()
+        job_workers = None
+    if sender_membership is not None:
+        await sender_membership.stop()
+        sender_membership = None
+
+
+async def start_leader_election():
+    global leader_lease, shard_membership
+    db = await get_database()
+    if SCHEDULER_MODE == "sharded":
+        shard_membership = ShardMembership(db, on_count=dispatcher.set_sender_processes)
+        await shard_membership.start()
+        return
+    leader_lease = LeaderLease(db, "scheduler")
+    await leader_lease.try_acquire()
+    leader_lease.start()
+
+
+async def stop_leader_election():
+    global leader_lease, shard_membership
+    if leader_lease is not None:
+        await leader_lease.stop()
+        leader_lease = None
+    if shard_membership is not None:
+        await shard_membership.stop()
+        shard_membership = None
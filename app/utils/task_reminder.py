@@ -0,0 +1,89 @@
+from typing import Iterable, List, Optional, Tuple
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup
+import hashlib
+import os
+
+# One message listing every task instead of a header plus one message per task
+REMINDER_CONSOLIDATED = os.getenv("REMINDER_CONSOLIDATED", "true").lower() == "true"
+# Suffix of the callback data of consolidated reminders, e.g. "complete:task1:list"
+LIST_CALLBACK_SUFFIX = "list"
+BUTTON_TITLE_CHARS = 24
+# Telegram rejects a whole message when one button's callback data is longer
+TELEGRAM_CALLBACK_DATA_LIMIT = 64
+# Ids that don't fit are sent as "#<hash>" and resolved against today's tasks
+TASK_REF_PREFIX = "#"
+
+
+def task_ref(task_id: str) -> str:
+    return TASK_REF_PREFIX + hashlib.sha1(task_id.encode()).hexdigest()[:12]
+
+
+def task_callback_data(action: str, task_id: str, suffix: Optional[str] = None) -> str:
+    """Callback data "action:task_id[:suffix]", within Telegram's 64 bytes"""
+    tail = [suffix] if suffix else []
+    data = ":".join([action, task_id, *tail])
+    if ":" in task_id or len(data.encode()) > TELEGRAM_CALLBACK_DATA_LIMIT:
+        data = ":".join([action, task_ref(task_id), *tail])
+    return data
+
+
+def resolve_task_id(task_id: str, task_ids: Iterable[str]) -> Optional[str]:
+    """Task id of callback data, None when a hashed id matches no task"""
+    if not task_id.startswith(TASK_REF_PREFIX):
+        return task_id
+    return next((tid for tid in task_ids if task_ref(tid) == task_id), None)
+
+
+def task_status_icon(task: dict) -> str:
+    if task.get("completed"):
+        return "✅"
+    if task.get("skipped"):
+        return "⏭"
+    return "⬜"
+
+
+def short_title(title: str) -> str:
+    if len(title) <= BUTTON_TITLE_CHARS:
+        return title
+    return title[: BUTTON_TITLE_CHARS - 1] + "…"
+
+
+def render_task_reminder(
+    first_name: str, tasks: List[dict]
+) -> Tuple[str, Optional[InlineKeyboardMarkup]]:
+    """Render all tasks of the day as one message with one keyboard row per open task"""
+    lines = [
+        f"👋 *Hi there {first_name}!*\n",
+        "Here are your daily tasks. Please confirm your progress with the buttons below.\n",
+    ]
+    rows = []
+    for i, task in enumerate(tasks, 1):
+        lines.append(f"{task_status_icon(task)} *{i}. {task['title']}*")
+        if task.get("note"):
+            lines.append(f"🗒️ _{task['note']}_")
+        lines.append(
+            f"🔢 *Minimum required:* {task['min_required_completion']} {task['completion_unit']}\n"
+        )
+        if not task.get("completed") and not task.get("skipped"):
+            rows.append(
+                [
+                    InlineKeyboardButton(
+                        f"✅ {i}. {short_title(task['title'])}",
+                        callback_data=task_callback_data(
+                            "complete", task["task_id"], LIST_CALLBACK_SUFFIX
+                        ),
+                    ),
+                    InlineKeyboardButton(
+                        f"⏭ Skip {i}",
+                        callback_data=task_callback_data(
+                            "skip", task["task_id"], LIST_CALLBACK_SUFFIX
+                        ),
+                    ),
+                ]
+            )
+
+    if not rows:
+        lines.append("🎉 _All tasks are done for today!_")
+    else:
+        lines.append("_Note: These reminder won’t appear in Rune chat history_")
+    return "\n".join(lines), InlineKeyboardMarkup(rows) if rows else None
@@ -0,0 +1,180 @@
+from typing import (
+    Any,
+    AsyncIterable,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    Optional,
+    Union,
+)
+from telegram import Bot, Message
+from telegram.error import RetryAfter, TimedOut
+from app.utils.bot_handler import bot
+from app.utils.util_func import retry_after_seconds
+import asyncio
+import time
+import os
+
+# Telegram allows about 30 messages per second per bot overall...
+TELEGRAM_GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", "30"))
+# ...shared by every process that sends: job queue workers run on every
+# replica (and every process in sharded mode). Each one gets an equal part
+# of the bot-wide rate. Unset, the count follows the live members (see
+# set_sender_processes); set it to pin the total number of such processes
+TELEGRAM_SENDER_PROCESSES = os.getenv("TELEGRAM_SENDER_PROCESSES")
+TELEGRAM_PROCESS_RATE = TELEGRAM_GLOBAL_RATE / max(
+    1, int(TELEGRAM_SENDER_PROCESSES or "1")
+)
+# ...and about one message per second in a single chat
+TELEGRAM_PER_CHAT_INTERVAL = float(os.getenv("TELEGRAM_PER_CHAT_INTERVAL", "1.0"))
+TELEGRAM_MAX_RETRIES = int(os.getenv("TELEGRAM_MAX_RETRIES", "3"))
+# Users processed at the same time by a scheduled fan-out
+DISPATCH_CONCURRENCY = int(os.getenv("DISPATCH_CONCURRENCY", "50"))
+
+
+class TokenBucket:
+    """Async token bucket: `rate` tokens per second, bursts up to `capacity`"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(
+            self.capacity, self.tokens + (now - self.updated_at) * self.rate
+        )
+        self.updated_at = now
+
+    def set_rate(self, rate: float):
+        self._refill()
+        self.rate = rate
+        self.capacity = rate
+        self.tokens = min(self.tokens, self.capacity)
+
+    def pause(self, seconds: float):
+        """Stop handing out tokens for `seconds`, e.g. after a flood-control error"""
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    async def acquire(self):
+        # Waiters queue on the lock, so tokens are handed out in FIFO order
+        async with self._lock:
+            blocked = self.blocked_until - time.monotonic()
+            if blocked > 0:
+                await asyncio.sleep(blocked)
+            self._refill()
+            if self.tokens < 1:
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= 1
+
+
+class TelegramDispatcher:
+    """Rate-limited sender shared by the scheduled fan-outs of the process.
+
+    The bucket is per process and holds this process's part of the bot-wide
+    limit, see TELEGRAM_SENDER_PROCESSES.
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        rate: float = TELEGRAM_PROCESS_RATE,
+        per_chat_interval: float = TELEGRAM_PER_CHAT_INTERVAL,
+        max_retries: int = TELEGRAM_MAX_RETRIES,
+    ):
+        self.bot = bot
+        self.bucket = TokenBucket(rate)
+        self.per_chat_interval = per_chat_interval
+        self.max_retries = max_retries
+        self._chat_next_at: Dict[int, float] = {}
+
+    def set_sender_processes(self, count: int):
+        """Split the bot-wide rate over `count` live sending processes"""
+        if TELEGRAM_SENDER_PROCESSES is not None:
+            return
+        rate = TELEGRAM_GLOBAL_RATE / max(1, count)
+        if rate != self.bucket.rate:
+            print(f"[TelegramDispatcher] {count} sender processes, {rate:.2f} msg/s")
+            self.bucket.set_rate(rate)
+
+    async def wait_for_chat(self, chat_id: int):
+        now = time.monotonic()
+        next_at = max(now, self._chat_next_at.get(chat_id, 0.0))
+        self._chat_next_at[chat_id] = next_at + self.per_chat_interval
+        if len(self._chat_next_at) > 10000:
+            self._chat_next_at = {
+                k: v for k, v in self._chat_next_at.items() if v > now
+            }
+        if next_at > now:
+            await asyncio.sleep(next_at - now)
+
+    async def call(self, chat_id: int, method: Callable[..., Awaitable[Any]], **kwargs):
+        """Run a Bot method for `chat_id` within the global and per-chat limits"""
+        for attempt in range(self.max_retries + 1):
+            await self.wait_for_chat(chat_id)
+            await self.bucket.acquire()
+            try:
+                return await method(chat_id=chat_id, **kwargs)
+            except RetryAfter as e:
+                if attempt == self.max_retries:
+                    raise
+                retry_after = retry_after_seconds(e.retry_after)
+                print("TELEGRAM_RETRY_AFTER", chat_id, retry_after)
+                # Flood control applies to the whole bot, hold every sender
+                self.bucket.pause(retry_after)
+            except TimedOut:
+                if attempt == self.max_retries:
+                    raise
+                await asyncio.sleep(2**attempt)
+
+    async def send_message(self, chat_id: int, text: str, **kwargs) -> Message:
+        return await self.call(chat_id, self.bot.send_message, text=text, **kwargs)
+
+
+async def run_bounded(
+    items: Union[Iterable[Any], AsyncIterable[Any]],
+    worker: Callable[[Any], Awaitable[Any]],
+    concurrency: int = DISPATCH_CONCURRENCY,
+    name: str = "DISPATCH",
+) -> dict:
+    """Run `worker` over `items` with at most `concurrency` in flight.
+
+    A failing item is logged and counted, it never stops the other items.
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 2)
+    stats = {"processed": 0, "failed": 0}
+
+    async def produce():
+        try:
+            if hasattr(items, "__aiter__"):
+                async for item in items:
+                    await queue.put(item)
+            else:
+                for item in items:
+                    await queue.put(item)
+        finally:
+            for _ in range(concurrency):
+                await queue.put(None)
+
+    async def consume():
+        while (item := await queue.get()) is not None:
+            try:
+                await worker(item)
+                stats["processed"] += 1
+            except Exception as e:
+                stats["failed"] += 1
+                print(f"{name}_ERR", e)
+
+    await asyncio.gather(produce(), *(consume() for _ in range(concurrency)))
+    print(f"[{name}] processed={stats['processed']} failed={stats['failed']}")
+    return stats
+
+
+# Process-wide dispatcher, so every fan-out shares one rate limit
+dispatcher = TelegramDispatcher(bot)
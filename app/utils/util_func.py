@@ -1,11 +1,79 @@
-from datetime import datetime
+from datetime import datetime, time, timedelta, tzinfo
+from functools import lru_cache
+from typing import Optional, Union
 import pytz
+import tiktoken
+import os
 
+# Timezone of users that haven't set one with /timezone
+DEFAULT_TIMEZONE = os.getenv("DEFAULT_TIMEZONE", "Asia/Jakarta")
 
-def get_current_time(loc: str):
-    jakarta_tz = pytz.timezone(loc)
-    curr_time = datetime.now(jakarta_tz)
-    return curr_time
+
+@lru_cache(maxsize=None)
+def get_tzinfo(name: Optional[str] = None) -> tzinfo:
+    """Cached pytz timezone, raises pytz.UnknownTimeZoneError for bad names"""
+    return pytz.timezone(name or DEFAULT_TIMEZONE)
+
+
+def is_valid_timezone(name: str) -> bool:
+    return name in pytz.all_timezones_set
+
+
+@lru_cache(maxsize=1)
+def _timezones_by_lower_name() -> dict:
+    return {name.lower(): name for name in pytz.all_timezones}
+
+
+def normalize_timezone(name: str) -> Optional[str]:
+    """Canonical name of a user-typed timezone ("asia/tokyo"), None if unknown"""
+    return _timezones_by_lower_name().get(name.strip().lower())
+
+
+def get_current_time(loc: Optional[str] = None):
+    return datetime.now(get_tzinfo(loc))
+
+
+def end_of_local_day(now: datetime) -> datetime:
+    """Next local midnight after `now`, in the timezone of `now`"""
+    midnight = datetime.combine(now.date() + timedelta(days=1), time())
+    # pytz zones pick the UTC offset in effect at midnight, which differs
+    # from the one of `now` across a DST change
+    if hasattr(now.tzinfo, "localize"):
+        return now.tzinfo.localize(midnight)
+    return midnight.replace(tzinfo=now.tzinfo)
+
+
+def to_local_date(ts: datetime, loc: Optional[str] = None) -> str:
+    """Local date of a timestamp, naive ones are UTC as returned by Mongo"""
+    if ts.tzinfo is None:
+        ts = pytz.utc.localize(ts)
+    return ts.astimezone(get_tzinfo(loc)).strftime("%Y-%m-%d")
+
+
+def retry_after_seconds(retry_after: Union[int, float, timedelta]) -> float:
+    """Telegram RetryAfter.retry_after, an int or a timedelta depending on PTB"""
+    if isinstance(retry_after, timedelta):
+        return retry_after.total_seconds()
+    return float(retry_after)
+
+
+@lru_cache(maxsize=None)
+def get_token_encoding(model: str = "gpt-4o"):
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("o200k_base")
+    except Exception as e:
+        # Encoding files could not be downloaded, fall back to an estimate
+        print("TOKEN_ENCODING_ERR", e)
+        return None
+
+
+def count_tokens(text: str, model: str = "gpt-4o") -> int:
+    encoding = get_token_encoding(model)
+    if encoding is None:
+        return len(text or "") // 4 + 1
+    return len(encoding.encode(text or ""))
 
 
 def get_mood_labels():